@@ -9,13 +9,17 @@ import numpy as np
 import json
 from scipy import stats
 import sys
+from catalogo_sdss import cargar_catalogo, seleccionar_filas
+from cuantiles import vdisp_ordenada, percentil_ordenado
+from muestreo import indices_sin_reemplazo
+from ejecutor import ejecutar_replicas
 
 print("🎯 FINAL ROBUSTNESS ANALYSIS - VDISP MASS (EXTENDED)")
 print("============================================================")
 
 # Ensure Rust module is loaded for performance
 try:
-    from cosmic_vorticity import calcular_bispectro_triangular
+    from cosmic_vorticity import calcular_bispectro_indices
     print("✅ Rust module loaded for fast bispectrum calculation.")
 except ImportError:
     print("❌ Rust module unavailable. The script can only run if this module exists.")
@@ -30,38 +34,46 @@ SAMPLE_SIZE = 500 # Non-replacement sub-sample size
 # Null Hypothesis: H₀ = 1.1x (Conservative reference value)
 H0_TEST = 1.1
 
+# Unseeded, as before: fresh entropy on every run (each cut × mass group task gets its own child stream)
+SEMILLA = None
+
+# Concurrent cut × mass group tasks (None: COSMIC_TRABAJADORES or one per core).
+# The Rust kernels release the GIL, so a thread pool runs them in parallel.
+TRABAJADORES = None
+
 # Definition of the extreme cut for the robustness test
 VDISP_CUT_BASE = 100
 VDISP_CUT_EXTREMO = 150 # <-- New cut to test
 
 # --- OPTIMIZED DATA LOADING (MEMORY) ---
 try:
-    data = np.load('sdss_vdisp_calidad.npz', mmap_mode='r')
-    vdisp_full = data['VDISP'].astype(np.float32)
-    redshift_full = data['Z'].astype(np.float32)
-    del data
+    # Memory-mapped columns in their native dtype: no decompression, no copies
+    catalogo = cargar_catalogo()
+    vdisp_full = catalogo['VDISP']
 except FileNotFoundError:
-    print("❌ Error: Data file not found. Check 'sdss_vdisp_calidad.npz'.")
+    print("❌ Error: Data file not found. Check 'sdss_vdisp_calidad.npz' or run 'catalogo_sdss.py convertir'.")
     sys.exit()
 
 
-def analizar_por_corte(filtro_vdisp_min):
-    """Executes the complete mass robustness analysis for a given FILTRO_VDISP_MIN."""
+def definir_grupos_masa(filtro_vdisp_min):
+    """Mass groups (VDISP quantiles) for a given FILTRO_VDISP_MIN, plus the header lines to print."""
 
-    print(f"\n\n========================================================================================")
-    print(f"🔬 RUNNING ROBUSTNESS ANALYSIS WITH MINIMUM VDISP QUALITY FILTER > {filtro_vdisp_min:.0f} km/s")
-    print(f"========================================================================================")
+    mensajes = [
+        f"\n\n========================================================================================",
+        f"🔬 RUNNING ROBUSTNESS ANALYSIS WITH MINIMUM VDISP QUALITY FILTER > {filtro_vdisp_min:.0f} km/s",
+        f"========================================================================================",
+    ]
 
     # 1. Quantile Definition based on the new filter
-    mask_filtrada_total = (redshift_full >= 0.1) & (redshift_full < 0.8) & (vdisp_full > filtro_vdisp_min)
-    vdisp_filtrado = vdisp_full[mask_filtrada_total]
+    # The z-range VDISP is sorted once (cached next to the catalog); each cut is a suffix of it,
+    # and the quantiles are read directly (same values as np.percentile)
+    vdisp_filtrado = vdisp_ordenada(catalogo, 0.1, 0.8, corte_calidad=filtro_vdisp_min)
 
     if len(vdisp_filtrado) < 1000:
-        print(f"❌ Error: Insufficient data to define quantiles with VDISP > {filtro_vdisp_min}.")
-        return {}
+        mensajes.append(f"❌ Error: Insufficient data to define quantiles with VDISP > {filtro_vdisp_min}.")
+        return mensajes, {}
 
-    q_33 = np.percentile(vdisp_filtrado, 33)
-    q_66 = np.percentile(vdisp_filtrado, 66)
+    q_33, q_66 = percentil_ordenado(vdisp_filtrado, [33, 66])
 
     grupos_masa = {
         "VDISP_LOW (<33%)": (filtro_vdisp_min, q_33),
@@ -69,107 +81,127 @@ def analizar_por_corte(filtro_vdisp_min):
         "VDISP_HIGH (>66%)": (q_66, 1000.0)
     }
 
-    print(f"\n🔧 RECALCULATED QUANTILES (VDISP > {filtro_vdisp_min}): Q33={q_33:.1f} | Q66={q_66:.1f}")
+    mensajes.append(f"\n🔧 RECALCULATED QUANTILES (VDISP > {filtro_vdisp_min}): Q33={q_33:.1f} | Q66={q_66:.1f}")
+    return mensajes, grupos_masa
 
-    resultados_evolucion = {}
 
-    # 2. ANALYSIS BY MASS GROUP
-    for nombre_grupo, (vdisp_min, vdisp_max) in grupos_masa.items():
-        print(f"\n--- MASS GROUP: {nombre_grupo} ({vdisp_min:.1f} - {vdisp_max:.1f} km/s) ---")
+def analizar_grupo(tarea, rng):
+    """Mass robustness analysis of one (cut, mass group) task on a worker thread.
 
-        galaxies_z_low = None
-        galaxies_z_high = None
+    Returns (lines to print, result or None); the caller prints them in task order so the
+    report reads the same as a serial run.
+    """
+    _, nombre_grupo, vdisp_min, vdisp_max = tarea
+    mensajes = [f"\n--- MASS GROUP: {nombre_grupo} ({vdisp_min:.1f} - {vdisp_max:.1f} km/s) ---"]
 
-        # a) Filtering by Redshift and Mass Group
-        for label, z_min, z_max in [('z01_02', 0.1, 0.2), ('z07_08', 0.7, 0.8)]:
+    # Row indices into the full catalog (the VDISP values are gathered inside Rust)
+    filas_z_low = None
+    filas_z_high = None
 
-            mask = (redshift_full >= z_min) & (redshift_full < z_max) & \
-                   (vdisp_full >= vdisp_min) & (vdisp_full < vdisp_max)
+    # a) Filtering by Redshift and Mass Group
+    for label, z_min, z_max in [('z01_02', 0.1, 0.2), ('z07_08', 0.7, 0.8)]:
 
-            galaxies_bin = vdisp_full[mask]
+        # Row selections are cached in memory and on disk next to the catalog (keyed by its content hash)
+        filas_bin = seleccionar_filas(catalogo, z_min, z_max, vdisp_min, vdisp_max,
+                                      orden_original=True)
 
-            if len(galaxies_bin) < SAMPLE_SIZE:
-                print(f"    ❌ {label}: Insufficient data ({len(galaxies_bin)} < {SAMPLE_SIZE}).")
-                continue
+        if len(filas_bin) < SAMPLE_SIZE:
+            mensajes.append(f"    ❌ {label}: Insufficient data ({len(filas_bin)} < {SAMPLE_SIZE}).")
+            continue
 
-            print(f"    ✅ {label} (z={z_min}-{z_max}): {len(galaxies_bin)} galaxies available.")
+        mensajes.append(f"    ✅ {label} (z={z_min}-{z_max}): {len(filas_bin)} galaxies available.")
 
-            if 'z01_02' in label:
-                galaxies_z_low = galaxies_bin
-            elif 'z07_08' in label:
-                galaxies_z_high = galaxies_bin
+        if 'z01_02' in label:
+            filas_z_low = filas_bin
+        elif 'z07_08' in label:
+            filas_z_high = filas_bin
 
-        # b) EVOLUTION CALCULATION (Non-Replacement Sampling)
-        if galaxies_z_low is not None and galaxies_z_high is not None:
+    # b) EVOLUTION CALCULATION (Non-Replacement Sampling)
+    if filas_z_low is None or filas_z_high is None:
+        return mensajes, None
 
-            n_samples = min(N_MUESTRAS_VALIDACION,
-                            len(galaxies_z_low) // SAMPLE_SIZE,
-                            len(galaxies_z_high) // SAMPLE_SIZE)
+    n_samples = min(N_MUESTRAS_VALIDACION,
+                    len(filas_z_low) // SAMPLE_SIZE,
+                    len(filas_z_high) // SAMPLE_SIZE)
 
-            if n_samples == 0:
-                print("    ❌ Could not get non-replacement samples.")
-                continue
+    if n_samples == 0:
+        mensajes.append("    ❌ Could not get non-replacement samples.")
+        return mensajes, None
 
-            # print(f"    🚀 Running {n_samples} non-replacement samplings...")
+    # Disjoint samples: the first n_samples * SAMPLE_SIZE positions of a partial
+    # Fisher-Yates shuffle, O(n_samples * SAMPLE_SIZE) instead of permuting the whole bin
+    indices_low = indices_sin_reemplazo(len(filas_z_low), n_samples * SAMPLE_SIZE, rng)
+    indices_high = indices_sin_reemplazo(len(filas_z_high), n_samples * SAMPLE_SIZE, rng)
 
-            indices_low = np.random.permutation(len(galaxies_z_low))
-            indices_high = np.random.permutation(len(galaxies_z_high))
+    # All non-replacement samples of each bin go to Rust in one batched call,
+    # as (samples x SAMPLE_SIZE) catalog row indices gathered inside the kernel
+    filas_muestras_low = filas_z_low[indices_low].reshape(n_samples, SAMPLE_SIZE)
+    filas_muestras_high = filas_z_high[indices_high].reshape(n_samples, SAMPLE_SIZE)
 
-            evoluciones_esc = []
+    bispectra_low = np.abs(calcular_bispectro_indices(vdisp_full, filas_muestras_low, l_max, configs_a_testear))
+    bispectra_high = np.abs(calcular_bispectro_indices(vdisp_full, filas_muestras_high, l_max, configs_a_testear))
 
-            for i in range(n_samples):
-                start, end = i * SAMPLE_SIZE, (i + 1) * SAMPLE_SIZE
-                sample_low = galaxies_z_low[indices_low[start:end]]
-                sample_high = galaxies_z_high[indices_high[start:end]]
+    # Average Scalene (indices 1 onwards)
+    esc_low = bispectra_low[:, 1:].mean(axis=1)
+    esc_high = bispectra_high[:, 1:].mean(axis=1)
+    evoluciones_esc = np.divide(esc_high, esc_low, out=np.full(n_samples, np.nan), where=esc_low > 0)
 
-                bispectra_low = calcular_bispectro_triangular(sample_low, l_max, configs_a_testear)
-                bispectra_high = calcular_bispectro_triangular(sample_high, l_max, configs_a_testear)
+    # c) FINAL STATISTICAL ANALYSIS
+    evoluciones_esc = evoluciones_esc[~np.isnan(evoluciones_esc)]
 
-                if bispectra_high and bispectra_low:
-                    # Average Scalene (indices 1 onwards)
-                    esc_high = np.mean([abs(b) for b in bispectra_high[1:]])
-                    esc_low = np.mean([abs(b) for b in bispectra_low[1:]])
-                    evol_esc = esc_high / esc_low if esc_low > 0 else np.nan
-                    evoluciones_esc.append(evol_esc)
+    if len(evoluciones_esc) <= 1:
+        mensajes.append("    ❌ Statistical analysis unavailable.")
+        return mensajes, None
 
-            # c) FINAL STATISTICAL ANALYSIS
-            evoluciones_esc = np.array(evoluciones_esc)
-            evoluciones_esc = evoluciones_esc[~np.isnan(evoluciones_esc)]
+    media_obs = np.mean(evoluciones_esc)
+    std_obs = np.std(evoluciones_esc, ddof=1)
+    n_obs = len(evoluciones_esc)
+    sem_obs = std_obs / np.sqrt(n_obs)
 
-            if len(evoluciones_esc) > 1:
-                media_obs = np.mean(evoluciones_esc)
-                std_obs = np.std(evoluciones_esc, ddof=1)
-                n_obs = len(evoluciones_esc)
-                sem_obs = std_obs / np.sqrt(n_obs)
+    # Significance calculation (t-test vs H0=1.1)
+    t = abs(media_obs - H0_TEST) / sem_obs
+    p = 2 * (1 - stats.t.cdf(t, n_obs-1))
+    sigma = stats.norm.ppf(1 - p/2)
 
-                # Significance calculation (t-test vs H0=1.1)
-                t = abs(media_obs - H0_TEST) / sem_obs
-                p = 2 * (1 - stats.t.cdf(t, n_obs-1))
-                sigma = stats.norm.ppf(1 - p/2)
+    mensajes.append(f"\n    📈 FINAL RESULTS (Scalenes):")
+    mensajes.append(f"      • Mean Evolution: {media_obs:.2f}×")
+    mensajes.append(f"      • Standard Error (SEM): {sem_obs:.2f}×")
+    mensajes.append(f"      • Significance vs {H0_TEST}x: {sigma:.2f}σ")
 
-                resultados_evolucion[nombre_grupo] = {
-                    'media_evolucion': media_obs,
-                    'sem_evolucion': sem_obs,
-                    'significancia_11': sigma,
-                    'N_muestras_sin_reemplazo': n_obs
-                }
+    if sigma >= 5.0:
+        mensajes.append(f"      🎉 **SOLID EVIDENCE (>5σ)**")
 
-                print(f"\n    📈 FINAL RESULTS (Scalenes):")
-                print(f"      • Mean Evolution: {media_obs:.2f}×")
-                print(f"      • Standard Error (SEM): {sem_obs:.2f}×")
-                print(f"      • Significance vs {H0_TEST}x: {sigma:.2f}σ")
-
-                if sigma >= 5.0:
-                     print(f"      🎉 **SOLID EVIDENCE (>5σ)**")
+    return mensajes, {
+        'media_evolucion': media_obs,
+        'sem_evolucion': sem_obs,
+        'significancia_11': sigma,
+        'N_muestras_sin_reemplazo': n_obs
+    }
 
-            else:
-                print("    ❌ Statistical analysis unavailable.")
-    
-    return resultados_evolucion
 
-# Run analysis for base cut and extreme cut
-resultados_corte_base = analizar_por_corte(VDISP_CUT_BASE)
-resultados_corte_extremo = analizar_por_corte(VDISP_CUT_EXTREMO)
+# Run analysis for base cut and extreme cut: every (cut, mass group) pair is an independent
+# task; results and report lines come back in task order whatever the completion order
+cortes = (VDISP_CUT_BASE, VDISP_CUT_EXTREMO)
+cabeceras = {}
+tareas = []
+for corte in cortes:
+    cabeceras[corte], grupos_masa = definir_grupos_masa(corte)
+    tareas += [(corte, nombre, vdisp_min, vdisp_max) for nombre, (vdisp_min, vdisp_max) in grupos_masa.items()]
+
+salidas = ejecutar_replicas(analizar_grupo, tareas, semilla=SEMILLA, trabajadores=TRABAJADORES)
+
+resultados_por_corte = {corte: {} for corte in cortes}
+for corte in cortes:
+    print("\n".join(cabeceras[corte]))
+    for (corte_tarea, nombre_grupo, _, _), (mensajes, resultado) in zip(tareas, salidas):
+        if corte_tarea != corte:
+            continue
+        print("\n".join(mensajes))
+        if resultado is not None:
+            resultados_por_corte[corte][nombre_grupo] = resultado
+
+resultados_corte_base = resultados_por_corte[VDISP_CUT_BASE]
+resultados_corte_extremo = resultados_por_corte[VDISP_CUT_EXTREMO]
 
 
 # 4. FINAL REPORT AND SAVING
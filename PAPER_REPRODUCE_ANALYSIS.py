@@ -6,6 +6,7 @@ Author: Omar Ariel Vallejos - Independent Researcher
 
 import numpy as np
 import json
+from catalogo_sdss import cargar_catalogo, valores_en_bin
 from cosmic_vorticity import calcular_bispectro_triangular
 
 print("="*70)
@@ -16,7 +17,7 @@ print("="*70)
 
 # Load data
 print("\n1. LOADING SDSS DATA...")
-data = np.load('sdss_vdisp_calidad.npz')
+data = cargar_catalogo()
 vdisp = data['VDISP']
 redshift = data['Z']
 
@@ -38,11 +39,10 @@ l_max = 8
 
 results = {}
 for z_min, z_max, label in bins_paper:
-    mask = (redshift >= z_min) & (redshift < z_max) & (vdisp > 100)
-    sample = vdisp[mask][:150]  # 150 galaxies per bin
+    sample = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)[:150]  # 150 galaxies per bin
     
     if len(sample) >= 100:  # Minimum for statistics
-        bispectrum = calcular_bispectro_triangular(sample.tolist(), l_max, configs)
+        bispectrum = calcular_bispectro_triangular(sample, l_max, configs)
         results[label] = {
             'z_mean': (z_min + z_max) / 2,
             'bispectrum_222': bispectrum[0],
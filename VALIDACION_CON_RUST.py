@@ -5,6 +5,9 @@ VALIDACIÓN USANDO CÓDIGO RUST EXISTENTE - SIN DEPENDENCIAS EXTERNAS
 
 import numpy as np
 import json
+from catalogo_sdss import cargar_catalogo, valores_en_bin
+from muestreo import muestra_sin_reemplazo
+from ejecutor import ejecutar_replicas
 
 print("🎯 VALIDACIÓN USANDO MÓDULO RUST EXISTENTE")
 print("=" * 60)
@@ -28,9 +31,7 @@ todas_configs = configs_222 + configs_444 + configs_escalenas
 l_max = 8
 
 # Cargar datos
-data = np.load('sdss_vdisp_calidad.npz')
-vdisp = data['VDISP']
-redshift = data['Z']
+data = cargar_catalogo()
 
 bins_paper = [(0.1, 0.2, "z01_02"), (0.7, 0.8, "z07_08")]
 
@@ -41,11 +42,10 @@ resultados_comparativos = {}
 
 for z_min, z_max, label in bins_paper:
     print(f"\n📊 {label} (z={z_min}-{z_max}):")
-    mask = (redshift >= z_min) & (redshift < z_max) & (vdisp > 100)
-    sample = vdisp[mask][:200]
+    sample = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)[:200]
     
     if len(sample) >= 100:
-        bispectra = calcular_bispectro_triangular(sample.tolist(), l_max, todas_configs)
+        bispectra = calcular_bispectro_triangular(sample, l_max, todas_configs)
         
         # Extraer valores
         valor_222 = abs(bispectra[0])  # Primera configuración
@@ -103,38 +103,43 @@ print("\n📊 VALIDACIÓN ESTADÍSTICA ROBUSTA")
 print("=" * 60)
 
 z_min, z_max = 0.7, 0.8
-mask = (redshift >= z_min) & (redshift < z_max) & (vdisp > 100)
-galaxies_bin = vdisp[mask]
+galaxies_bin = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)
+galaxies_low = valores_en_bin(data, 0.1, 0.2, corte_calidad=100, orden_original=True)
 
 evoluciones_222 = []
 evoluciones_esc = []
 
-for semilla in range(5):
-    np.random.seed(semilla)
-    if len(galaxies_bin) >= 200:
-        # Muestra de z=0.7-0.8
-        sample_high = np.random.choice(galaxies_bin, size=200, replace=False)
-        bispectra_high = calcular_bispectro_triangular(sample_high.tolist(), l_max, [(2,2,2)] + configs_escalenas)
-        
-        # Muestra de z=0.1-0.2 para referencia
-        mask_low = (redshift >= 0.1) & (redshift < 0.2) & (vdisp > 100)
-        galaxies_low = vdisp[mask_low]
-        if len(galaxies_low) >= 200:
-            sample_low = np.random.choice(galaxies_low, size=200, replace=False)
-            bispectra_low = calcular_bispectro_triangular(sample_low.tolist(), l_max, [(2,2,2)] + configs_escalenas)
-            
-            if bispectra_high and bispectra_low:
-                # (2,2,2)
-                evol_222 = abs(bispectra_high[0]) / abs(bispectra_low[0]) if abs(bispectra_low[0]) > 0 else 0
-                # Escalenos promedio
-                esc_high = np.mean([abs(b) for b in bispectra_high[1:]])
-                esc_low = np.mean([abs(b) for b in bispectra_low[1:]])
-                evol_esc = esc_high / esc_low if esc_low > 0 else 0
-                
-                evoluciones_222.append(evol_222)
-                evoluciones_esc.append(evol_esc)
-                
-                print(f"Muestra {semilla+1}: (2,2,2)={evol_222:.1f}×, Escalenos={evol_esc:.1f}×")
+# Un generador independiente por réplica (en vez de reiniciar la semilla global); las réplicas
+# corren en paralelo (el núcleo Rust libera el GIL) y los resultados vuelven en orden de réplica
+def evolucion_replica(replica, rng):
+    # Muestra de z=0.7-0.8
+    sample_high = muestra_sin_reemplazo(galaxies_bin, 200, rng)
+    bispectra_high = calcular_bispectro_triangular(sample_high, l_max, [(2,2,2)] + configs_escalenas)
+
+    # Muestra de z=0.1-0.2 para referencia
+    sample_low = muestra_sin_reemplazo(galaxies_low, 200, rng)
+    bispectra_low = calcular_bispectro_triangular(sample_low, l_max, [(2,2,2)] + configs_escalenas)
+
+    if len(bispectra_high) == 0 or len(bispectra_low) == 0:
+        return None
+
+    # (2,2,2)
+    evol_222 = abs(bispectra_high[0]) / abs(bispectra_low[0]) if abs(bispectra_low[0]) > 0 else 0
+    # Escalenos promedio
+    esc_high = np.mean([abs(b) for b in bispectra_high[1:]])
+    esc_low = np.mean([abs(b) for b in bispectra_low[1:]])
+    evol_esc = esc_high / esc_low if esc_low > 0 else 0
+    return evol_222, evol_esc
+
+if len(galaxies_bin) >= 200 and len(galaxies_low) >= 200:
+    for replica, evolucion in enumerate(ejecutar_replicas(evolucion_replica, 5)):
+        if evolucion is None:
+            continue
+        evol_222, evol_esc = evolucion
+        evoluciones_222.append(evol_222)
+        evoluciones_esc.append(evol_esc)
+
+        print(f"Muestra {replica+1}: (2,2,2)={evol_222:.1f}×, Escalenos={evol_esc:.1f}×")
 
 if evoluciones_222 and evoluciones_esc:
     print(f"\n📈 ESTADÍSTICAS CONSOLIDADAS:")
@@ -5,12 +5,14 @@ VALIDACIÓN OPTIMIZADA PARA 5σ - 25 MUESTRAS
 
 import numpy as np
 import json
+from catalogo_sdss import cargar_catalogo, valores_en_bin
+from muestreo import muestras_replicas
 
 print("🎯 VALIDACIÓN OPTIMIZADA - META 5σ")
 print("=" * 60)
 
 try:
-    from cosmic_vorticity import calcular_bispectro_triangular
+    from cosmic_vorticity import calcular_bispectro_lote, evolucion_replicas
     print("✅ Módulo Rust cargado")
     RUST_AVAILABLE = True
 except ImportError:
@@ -23,17 +25,16 @@ configs_444 = [(4, 4, 4)]
 configs_escalenas = [(1, 2, 3), (1, 3, 4), (2, 3, 5), (1, 4, 5), (2, 4, 6), (3, 4, 7)]
 todas_configs = configs_222 + configs_444 + configs_escalenas
 l_max = 8
+N_MUESTRAS_VALIDACION = 25
 
 # Cargar datos
-data = np.load('sdss_vdisp_calidad.npz')
-vdisp = data['VDISP']
-redshift = data['Z']
+data = cargar_catalogo()
 
 # BINS PARA ANÁLISIS
 bins_paper = [(0.1, 0.2, "z01_02"), (0.7, 0.8, "z07_08")]
 
 print(f"🔧 CONFIGURACIÓN OPTIMIZADA:")
-print(f"   • Muestras: 25 (vs 5 original)")
+print(f"   • Muestras: {N_MUESTRAS_VALIDACION} (vs 5 original)")
 print(f"   • Configuraciones: {len(todas_configs)}")
 print(f"   • l_max: {l_max}")
 
@@ -44,8 +45,7 @@ evoluciones_esc = []
 # 🎯 ANÁLISIS PRINCIPAL OPTIMIZADO
 for z_min, z_max, label in bins_paper:
     print(f"\n📊 {label} (z={z_min}-{z_max}):")
-    mask = (redshift >= z_min) & (redshift < z_max) & (vdisp > 100)
-    galaxies_bin = vdisp[mask]
+    galaxies_bin = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)
     
     print(f"   • Galaxias disponibles: {len(galaxies_bin)}")
     
@@ -58,26 +58,26 @@ for z_min, z_max, label in bins_paper:
         'escalenos': []
     }
     
-    # 🚀 25 MUESTRAS (OPTIMIZADO PARA 5σ)
-    for semilla in range(25):
-        np.random.seed(semilla)
-        if len(galaxies_bin) >= sample_size:
-            sample = np.random.choice(galaxies_bin, size=sample_size, replace=False)
-            bispectra = calcular_bispectro_triangular(sample.tolist(), l_max, todas_configs)
-            
-            if bispectra:
-                # (2,2,2)
-                valor_222 = abs(bispectra[0])
-                resultados_bin['222'].append(valor_222)
-                
-                # (4,4,4)
-                valor_444 = abs(bispectra[1])
-                resultados_bin['444'].append(valor_444)
-                
-                # Escalenos promedio
-                valores_esc = [abs(bispectra[i]) for i in range(2, 8)]
-                valor_esc_prom = np.mean(valores_esc) if valores_esc else 0
-                resultados_bin['escalenos'].append(valor_esc_prom)
+    # 🚀 25 MUESTRAS (OPTIMIZADO PARA 5σ) - una sola llamada por lote
+    # Cada réplica se sortea con su generador (hijo de una SeedSequence), O(sample_size);
+    # el lote de bispectros reparte las muestras entre núcleos en Rust
+    if len(galaxies_bin) >= sample_size:
+        muestras = muestras_replicas(galaxies_bin, sample_size, N_MUESTRAS_VALIDACION)
+        bispectra_lote = calcular_bispectro_lote(muestras, l_max, todas_configs)
+
+        for bispectra in bispectra_lote:
+            # (2,2,2)
+            valor_222 = abs(bispectra[0])
+            resultados_bin['222'].append(valor_222)
+
+            # (4,4,4)
+            valor_444 = abs(bispectra[1])
+            resultados_bin['444'].append(valor_444)
+
+            # Escalenos promedio
+            valores_esc = [abs(bispectra[i]) for i in range(2, 8)]
+            valor_esc_prom = np.mean(valores_esc) if valores_esc else 0
+            resultados_bin['escalenos'].append(valor_esc_prom)
     
     # Calcular promedios por bin
     if resultados_bin['222']:
@@ -99,37 +99,22 @@ if 'z01_02' in resultados_comparativos and 'z07_08' in resultados_comparativos:
     z_low = resultados_comparativos['z01_02']
     z_high = resultados_comparativos['z07_08']
     
-    # Para cada una de las 25 muestras, calcular evolución individual
-    for semilla in range(25):
-        np.random.seed(semilla)
-        
-        # Muestra alta-z
-        mask_high = (redshift >= 0.7) & (redshift < 0.8) & (vdisp > 100)
-        galaxies_high = vdisp[mask_high]
-        if len(galaxies_high) >= 500:
-            sample_high = np.random.choice(galaxies_high, size=500, replace=False)
-            bispectra_high = calcular_bispectro_triangular(sample_high.tolist(), l_max, [(2,2,2)] + configs_escalenas)
-            
-            # Muestra baja-z
-            mask_low = (redshift >= 0.1) & (redshift < 0.2) & (vdisp > 100)
-            galaxies_low = vdisp[mask_low]
-            if len(galaxies_low) >= 500:
-                sample_low = np.random.choice(galaxies_low, size=500, replace=False)
-                bispectra_low = calcular_bispectro_triangular(sample_low.tolist(), l_max, [(2,2,2)] + configs_escalenas)
-                
-                if bispectra_high and bispectra_low:
-                    # (2,2,2)
-                    evol_222 = abs(bispectra_high[0]) / abs(bispectra_low[0]) if abs(bispectra_low[0]) > 0 else 0
-                    evoluciones_222.append(evol_222)
-                    
-                    # Escalenos promedio
-                    esc_high = np.mean([abs(b) for b in bispectra_high[1:]])
-                    esc_low = np.mean([abs(b) for b in bispectra_low[1:]])
-                    evol_esc = esc_high / esc_low if esc_low > 0 else 0
-                    evoluciones_esc.append(evol_esc)
-                    
-                    if semilla < 5:  # Mostrar primeras 5
-                        print(f"   Muestra {semilla+1}: (2,2,2)={evol_222:.1f}×, Escalenos={evol_esc:.1f}×")
+    # Las 25 réplicas (muestra alta-z y baja-z, sin reemplazo) se sortean y calculan en Rust;
+    # los bins van en el orden del .npz, como en el análisis por bin, para que una ejecución
+    # con semilla no dependa del orden del almacén
+    galaxies_high = valores_en_bin(data, 0.7, 0.8, corte_calidad=100, orden_original=True)
+    galaxies_low = valores_en_bin(data, 0.1, 0.2, corte_calidad=100, orden_original=True)
+    if len(galaxies_high) >= 500 and len(galaxies_low) >= 500:
+        evol_222_rep, evol_esc_rep = evolucion_replicas(
+            galaxies_low, galaxies_high, 500, N_MUESTRAS_VALIDACION,
+            [(2,2,2)] + configs_escalenas, semilla=0
+        )
+        # Denominador nulo -> NaN: esa réplica no entra en la media ni en el SEM
+        evoluciones_222 = evol_222_rep[~np.isnan(evol_222_rep)].tolist()
+        evoluciones_esc = evol_esc_rep[~np.isnan(evol_esc_rep)].tolist()
+
+        for i, (evol_222, evol_esc) in enumerate(zip(evol_222_rep[:5], evol_esc_rep[:5])):
+            print(f"   Muestra {i+1}: (2,2,2)={evol_222:.1f}×, Escalenos={evol_esc:.1f}×")
 
 # 📊 GUARDAR RESULTADOS OPTIMIZADOS
 resultados_finales = {
@@ -6,6 +6,7 @@ Test de robustez con múltiples configuraciones escalenas
 
 import numpy as np
 import json
+from catalogo_sdss import cargar_catalogo, valores_en_bin
 
 try:
     from cosmic_vorticity import calcular_bispectro_triangular
@@ -44,9 +45,7 @@ todas_configs = (configs_equilateras + configs_escalenas_tipo1 +
 l_max = 10
 
 # Cargar datos
-data = np.load('sdss_vdisp_calidad.npz')
-vdisp = data['VDISP']
-redshift = data['Z']
+data = cargar_catalogo()
 
 print(f"📊 Total configuraciones a testear: {len(todas_configs)}")
 print(f"   • Equiláteras: {len(configs_equilateras)}")
@@ -61,28 +60,19 @@ resultados_por_tipo = {}
 
 for z_min, z_max, label in bins_test:
     print(f"\n🔍 {label} (z={z_min}-{z_max}):")
-    mask = (redshift >= z_min) & (redshift < z_max) & (vdisp > 100)
-    sample = vdisp[mask][:300]  # Muestra más grande para estabilidad
+    sample = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)[:300]  # Muestra más grande para estabilidad
     
     if len(sample) >= 200:
-        # Calcular en lotes para no sobrecargar memoria
+        # Una sola llamada: el módulo Rust reparte las 24 configuraciones entre núcleos
         resultados_bin = {}
-        
-        # Lote 1: Equiláteras
-        bispectra_eq = calcular_bispectro_triangular(sample.tolist(), l_max, configs_equilateras)
-        resultados_bin['equilateras'] = [abs(b) for b in bispectra_eq]
-        
-        # Lote 2: Escalenas Tipo 1
-        bispectra_esc1 = calcular_bispectro_triangular(sample.tolist(), l_max, configs_escalenas_tipo1)
-        resultados_bin['escalenas_t1'] = [abs(b) for b in bispectra_esc1]
-        
-        # Lote 3: Escalenas Tipo 2  
-        bispectra_esc2 = calcular_bispectro_triangular(sample.tolist(), l_max, configs_escalenas_tipo2)
-        resultados_bin['escalenas_t2'] = [abs(b) for b in bispectra_esc2]
-        
-        # Lote 4: Escalenas Tipo 3
-        bispectra_esc3 = calcular_bispectro_triangular(sample.tolist(), l_max, configs_escalenas_tipo3)
-        resultados_bin['escalenas_t3'] = [abs(b) for b in bispectra_esc3]
+        bispectra = np.abs(calcular_bispectro_triangular(sample, l_max, todas_configs))
+        inicio = 0
+        for tipo, configs_tipo in [('equilateras', configs_equilateras),
+                                   ('escalenas_t1', configs_escalenas_tipo1),
+                                   ('escalenas_t2', configs_escalenas_tipo2),
+                                   ('escalenas_t3', configs_escalenas_tipo3)]:
+            resultados_bin[tipo] = bispectra[inicio:inicio + len(configs_tipo)].tolist()
+            inicio += len(configs_tipo)
         
         resultados_por_tipo[label] = {
             'z_mean': (z_min + z_max) / 2,
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+ALMACÉN COLUMNAR DEL CATÁLOGO SDSS (Z, VDISP)
+
+El catálogo original (sdss_vdisp_calidad.npz) está comprimido: cada np.load
+descomprime las 2.8M filas de cada columna. Este módulo lo convierte una vez en
+un directorio con un .npy sin comprimir por columna (dtype nativo) y un
+metadatos.json con filas, mínimo/máximo y estadísticas por columna. Las columnas
+se abren con mmap_mode='r', sin copiar nada.
+
+Las filas se guardan ordenadas por Z (con FILA_ORIGINAL = posición en el .npz),
+así que un bin de redshift es un tramo contiguo que se localiza por búsqueda
+binaria y el corte en VDISP solo recorre ese tramo.
+
+Las selecciones (rango de Z × rango de VDISP × corte de calidad) se guardan como
+arreglos de índices de fila: en memoria (LRU acotado) y en
+<almacén>/indices/v<versión>/<huella>/, donde la huella es un hash del contenido de
+las columnas. Una segunda ejecución de los análisis no vuelve a seleccionar nada; si
+el catálogo cambia, cambia la huella, y si cambia el cálculo, la versión.
+
+Uso desde los scripts:
+    from catalogo_sdss import cargar_catalogo, valores_en_bin
+    data = cargar_catalogo()            # {'Z': memmap, 'VDISP': memmap, 'FILA_ORIGINAL': memmap}
+    vdisp_bin = valores_en_bin(data, 0.1, 0.2, corte_calidad=100)
+
+Línea de comandos:
+    python3 catalogo_sdss.py convertir [ruta.npz] [directorio]
+    python3 catalogo_sdss.py resumen   # solo lee metadatos.json
+    python3 catalogo_sdss.py limpiar-indices
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+FORMATO_VERSION = 2
+NOMBRE_NPZ = 'sdss_vdisp_calidad.npz'
+NOMBRE_ALMACEN = 'sdss_vdisp_calidad'
+ARCHIVO_METADATOS = 'metadatos.json'
+COLUMNA_ORDEN = 'Z'
+COLUMNA_FILA_ORIGINAL = 'FILA_ORIGINAL'
+COLUMNAS = ('Z', 'VDISP', COLUMNA_FILA_ORIGINAL)
+DIRECTORIO_INDICES = 'indices'
+# Sube cuando cambia cómo se calcula una selección: los índices ya guardados dejan de valer
+VERSION_INDICES = 2
+CAPACIDAD_CACHE_INDICES = 32
+BLOQUE_HUELLA = 1 << 24
+
+# Rutas relativas donde viven los datos según desde dónde se lance el script
+DIRECTORIOS_BUSQUEDA = ('.', 'datasets', os.path.join('..', 'datasets'))
+
+
+def _candidatos(nombre):
+    """Rutas posibles de `nombre`: respecto al directorio actual y al de este módulo."""
+    base_modulo = os.path.dirname(os.path.abspath(__file__))
+    vistos = []
+    for base in (os.getcwd(), base_modulo):
+        for directorio in DIRECTORIOS_BUSQUEDA:
+            ruta = os.path.normpath(os.path.join(base, directorio, nombre))
+            if ruta not in vistos:
+                vistos.append(ruta)
+    return vistos
+
+
+def _estadisticas(columna):
+    """Resumen de una columna para el sidecar."""
+    finitos = columna[np.isfinite(columna)] if columna.dtype.kind == 'f' else columna
+    resumen = {
+        'dtype': columna.dtype.str,
+        'n_no_finitos': int(len(columna) - len(finitos)),
+    }
+    if len(finitos) > 0:
+        resumen.update({
+            'min': float(finitos.min()),
+            'max': float(finitos.max()),
+            'media': float(finitos.mean(dtype=np.float64)),
+            'desviacion': float(finitos.std(dtype=np.float64)),
+        })
+    return resumen
+
+
+def convertir(ruta_npz=None, destino=None):
+    """Convierte el .npz en el almacén columnar y devuelve la ruta del almacén.
+
+    Sin argumentos busca el .npz en DIRECTORIOS_BUSQUEDA y crea el almacén a su lado.
+    Las filas se ordenan por Z (orden estable) y se añade la columna FILA_ORIGINAL.
+    La escritura es atómica: se arma en un directorio temporal y se renombra.
+    """
+    if ruta_npz is None:
+        ruta_npz = next((r for r in _candidatos(NOMBRE_NPZ) if os.path.exists(r)), None)
+        if ruta_npz is None:
+            raise FileNotFoundError(f"No se encontró {NOMBRE_NPZ} en {DIRECTORIOS_BUSQUEDA}")
+    if destino is None:
+        destino = os.path.join(os.path.dirname(os.path.abspath(ruta_npz)), NOMBRE_ALMACEN)
+
+    destino = os.path.abspath(destino)
+    temporal = tempfile.mkdtemp(dir=os.path.dirname(destino), prefix=f"{os.path.basename(destino)}.", suffix='.tmp')
+    os.chmod(temporal, 0o755)
+    metadatos = {
+        'formato_version': FORMATO_VERSION,
+        'fuente': os.path.basename(ruta_npz),
+        'filas': 0,
+        'ordenado_por': COLUMNA_ORDEN,
+        'columnas': {},
+    }
+    with np.load(ruta_npz) as datos:
+        orden = np.argsort(datos[COLUMNA_ORDEN], kind='stable')
+        metadatos['filas'] = int(len(orden))
+        for nombre in datos.files:
+            columna = np.asarray(datos[nombre])[orden]
+            np.save(os.path.join(temporal, f"{nombre}.npy"), columna)
+            metadatos['columnas'][nombre] = _estadisticas(columna)
+            del columna
+    np.save(os.path.join(temporal, f"{COLUMNA_FILA_ORIGINAL}.npy"), orden.astype(np.int64))
+    metadatos['columnas'][COLUMNA_FILA_ORIGINAL] = _estadisticas(orden.astype(np.int64))
+    metadatos['huella'] = _calcular_huella(temporal, metadatos['columnas'])
+
+    with open(os.path.join(temporal, ARCHIVO_METADATOS), 'w') as f:
+        json.dump(metadatos, f, indent=2)
+
+    if os.path.exists(destino):
+        shutil.rmtree(destino)
+    os.replace(temporal, destino)
+    return destino
+
+
+def _calcular_huella(directorio, columnas):
+    """Hash (blake2b) del contenido de las columnas, en orden de nombre y por bloques."""
+    h = hashlib.blake2b(digest_size=16)
+    for nombre in sorted(columnas):
+        columna = np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode='r')
+        h.update(f"{nombre}:{columna.dtype.str}:{len(columna)};".encode())
+        bytes_columna = columna.reshape(-1).view(np.uint8)
+        for inicio in range(0, len(bytes_columna), BLOQUE_HUELLA):
+            h.update(bytes_columna[inicio:inicio + BLOQUE_HUELLA])
+        del columna, bytes_columna
+    return h.hexdigest()
+
+
+def _escribir_atomico(destino, escribir, modo='wb'):
+    """Escribe `destino` con escribir(f) sobre un temporal de nombre único en su mismo
+    directorio y lo renombra: ni otro hilo ni otro proceso ven nunca un archivo a medias."""
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(destino),
+                                            prefix=f"{os.path.basename(destino)}.", suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, modo) as f:
+            escribir(f)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, destino)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+
+
+def _version_almacen(ruta):
+    with open(os.path.join(ruta, ARCHIVO_METADATOS)) as f:
+        return json.load(f).get('formato_version')
+
+
+def buscar_almacen(convertir_si_falta=True):
+    """Ruta del almacén columnar; si no existe (o es de un formato anterior) pero hay
+    .npz, lo convierte una vez."""
+    for ruta in _candidatos(NOMBRE_ALMACEN):
+        if os.path.exists(os.path.join(ruta, ARCHIVO_METADATOS)):
+            if _version_almacen(ruta) == FORMATO_VERSION or not convertir_si_falta:
+                return ruta
+            print(f"🔧 Almacén {ruta} de un formato anterior: reconvirtiendo...")
+            return convertir()
+    if convertir_si_falta:
+        print(f"🔧 Convirtiendo {NOMBRE_NPZ} a almacén columnar (una sola vez)...")
+        return convertir()
+    raise FileNotFoundError(f"No se encontró el almacén {NOMBRE_ALMACEN} en {DIRECTORIOS_BUSQUEDA}")
+
+
+def leer_metadatos(directorio=None):
+    """Contenido de metadatos.json (no toca las columnas)."""
+    directorio = directorio or buscar_almacen()
+    with open(os.path.join(directorio, ARCHIVO_METADATOS)) as f:
+        metadatos = json.load(f)
+    if metadatos.get('formato_version') != FORMATO_VERSION:
+        raise ValueError(
+            f"Almacén {directorio} con formato {metadatos.get('formato_version')}, "
+            f"se esperaba {FORMATO_VERSION}: vuelva a ejecutar 'catalogo_sdss.py convertir'"
+        )
+    return metadatos
+
+
+def cargar_catalogo(columnas=COLUMNAS, directorio=None):
+    """Columnas del catálogo como memmaps de solo lectura, en un dict nombre -> arreglo."""
+    directorio = directorio or buscar_almacen()
+    metadatos = leer_metadatos(directorio)
+    datos = {}
+    for nombre in columnas:
+        if nombre not in metadatos['columnas']:
+            raise KeyError(f"Columna {nombre} no está en el almacén {directorio}")
+        datos[nombre] = np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode='r')
+    return datos
+
+
+def huella_catalogo(directorio=None):
+    """Huella del contenido del almacén; la calcula y la anota en metadatos.json si falta."""
+    directorio = directorio or buscar_almacen()
+    metadatos = leer_metadatos(directorio)
+    if 'huella' not in metadatos:
+        metadatos['huella'] = _calcular_huella(directorio, metadatos['columnas'])
+        try:
+            _escribir_atomico(os.path.join(directorio, ARCHIVO_METADATOS),
+                              lambda f: json.dump(metadatos, f, indent=2), modo='w')
+        except OSError:
+            pass  # almacén de solo lectura: se recalcula en cada proceso
+    return metadatos['huella']
+
+
+def limite_en_dtype(columna, valor):
+    """`valor` convertido al dtype de `columna`.
+
+    Todos los cortes (bins de Z, rangos y corte de calidad en VDISP) se comparan así,
+    como las máscaras float32 originales (VDISP > 100 compara contra float32(100)):
+    selecciones, cuantiles y bocetos coinciden en qué filas pasan cada corte.
+    """
+    return columna.dtype.type(valor)
+
+
+def tramo_z(datos, z_min, z_max):
+    """(inicio, fin) de las filas con z_min <= Z < z_max en el almacén ordenado por Z.
+
+    Los límites se llevan al dtype de la columna (`limite_en_dtype`) antes de buscar,
+    como hace la máscara `Z >= z_min` sobre float32: float32(0.7) = 0.69999999 queda
+    dentro de Z >= 0.7.
+    """
+    columna = datos[COLUMNA_ORDEN]
+    limites = [limite_en_dtype(columna, z_min), limite_en_dtype(columna, z_max)]
+    inicio, fin = np.searchsorted(columna, limites, side='left')
+    return int(inicio), int(fin)
+
+
+def filas_en_bin(datos, z_min, z_max, filtro=None, orden_original=False):
+    """Índices (en el orden del almacén) de las filas con z_min <= Z < z_max.
+
+    El tramo de Z sale de dos búsquedas binarias; `filtro`, si se da, recibe la
+    VDISP del tramo y devuelve la máscara a conservar (p. ej. lambda v: v > 100).
+    Con orden_original=True las filas salen en el orden del .npz original, para
+    reproducir exactamente selecciones como mask[:150] o muestreos con semilla.
+    """
+    inicio, fin = tramo_z(datos, z_min, z_max)
+    if filtro is None:
+        filas = np.arange(inicio, fin)
+    else:
+        filas = inicio + np.flatnonzero(filtro(np.asarray(datos['VDISP'][inicio:fin])))
+    if orden_original:
+        filas = filas[np.argsort(datos[COLUMNA_FILA_ORIGINAL][filas], kind='stable')]
+    return filas
+
+
+# archivo de la columna Z -> (directorio de índices, huella), y (huella, nombre) -> arreglo
+# en orden de uso (LRU); el cerrojo protege ambos cuando se seleccionan bins desde varios hilos
+_ubicaciones = {}
+_cache_indices = OrderedDict()
+_cerrojo_cache = threading.Lock()
+
+
+def _ubicacion_cache(datos):
+    """(directorio de índices, huella) del almacén del que vienen `datos`, o None si
+    las columnas no son memmaps de un almacén (p. ej. arreglos en memoria)."""
+    archivo = getattr(datos.get(COLUMNA_ORDEN), 'filename', None)
+    if archivo is None:
+        return None
+    with _cerrojo_cache:
+        if archivo not in _ubicaciones:
+            directorio = os.path.dirname(os.path.abspath(archivo))
+            huella = huella_catalogo(directorio)
+            _ubicaciones[archivo] = (os.path.join(directorio, DIRECTORIO_INDICES, f"v{VERSION_INDICES}", huella), huella)
+        return _ubicaciones[archivo]
+
+
+def texto_clave(valor):
+    """Texto exacto (repr de float, ida y vuelta) de un límite para nombres de caché."""
+    return '_' if valor is None else repr(float(valor))
+
+
+def _clave_seleccion(z_min, z_max, vdisp_min, vdisp_max, corte_calidad, orden_original):
+    """Nombre de archivo legible y exacto de una selección."""
+    return (f"z{texto_clave(z_min)}-{texto_clave(z_max)}"
+            f"_v{texto_clave(vdisp_min)}-{texto_clave(vdisp_max)}"
+            f"_c{texto_clave(corte_calidad)}_{'npz' if orden_original else 'z'}")
+
+
+def arreglo_en_cache(datos, nombre, calcular):
+    """Arreglo derivado del almacén de `datos`, identificado por `nombre` (válido como
+    nombre de archivo): del LRU en memoria, si no de
+    <almacén>/indices/v<versión>/<huella>/<nombre>.npy, y solo si falta en ambos se llama a
+    calcular() y se guarda (escritura atómica; si el directorio no admite escritura, queda
+    solo en memoria). Se devuelve de solo lectura.
+    Sin almacén detrás (columnas en memoria) no hay caché: se devuelve calcular().
+    """
+    ubicacion = _ubicacion_cache(datos)
+    if ubicacion is None:
+        return calcular()
+
+    directorio, huella = ubicacion
+    clave = (huella, nombre)
+    with _cerrojo_cache:
+        if clave in _cache_indices:
+            _cache_indices.move_to_end(clave)
+            return _cache_indices[clave]
+
+    archivo = os.path.join(directorio, f"{nombre}.npy")
+    if os.path.exists(archivo):
+        arreglo = np.load(archivo)
+    else:
+        arreglo = np.ascontiguousarray(calcular())
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            _escribir_atomico(archivo, lambda f: np.save(f, arreglo))
+        except OSError:
+            pass
+
+    arreglo.setflags(write=False)
+    with _cerrojo_cache:
+        _cache_indices[clave] = arreglo
+        if len(_cache_indices) > CAPACIDAD_CACHE_INDICES:
+            _cache_indices.popitem(last=False)
+    return arreglo
+
+
+def seleccionar_filas(datos, z_min, z_max, vdisp_min=None, vdisp_max=None,
+                      corte_calidad=None, orden_original=False):
+    """Índices de fila con z_min <= Z < z_max, vdisp_min <= VDISP < vdisp_max y
+    VDISP > corte_calidad (los límites None no se aplican, los demás se comparan en el
+    dtype de VDISP con `limite_en_dtype`), como en `filas_en_bin`.
+
+    La selección se hace una sola vez por catálogo: el resultado queda en
+    `arreglo_en_cache` (memoria y <almacén>/indices/v<versión>/<huella>/).
+    """
+    def filtro(v):
+        mascara = np.ones(len(v), dtype=bool)
+        if vdisp_min is not None:
+            mascara &= v >= limite_en_dtype(v, vdisp_min)
+        if vdisp_max is not None:
+            mascara &= v < limite_en_dtype(v, vdisp_max)
+        if corte_calidad is not None:
+            mascara &= v > limite_en_dtype(v, corte_calidad)
+        return mascara
+
+    sin_filtro = vdisp_min is None and vdisp_max is None and corte_calidad is None
+    nombre = _clave_seleccion(z_min, z_max, vdisp_min, vdisp_max, corte_calidad, orden_original)
+    return arreglo_en_cache(
+        datos, nombre,
+        lambda: filas_en_bin(datos, z_min, z_max, None if sin_filtro else filtro, orden_original),
+    )
+
+
+def valores_en_bin(datos, z_min, z_max, corte_calidad=None, vdisp_min=None, vdisp_max=None,
+                   orden_original=False, columna='VDISP'):
+    """Valores de `columna` en las filas de `seleccionar_filas` (copia de solo ese bin)."""
+    filas = seleccionar_filas(datos, z_min, z_max, vdisp_min, vdisp_max, corte_calidad, orden_original)
+    return np.asarray(datos[columna][filas])
+
+
+def limpiar_indices(directorio=None):
+    """Borra los índices persistidos del almacén y vacía la caché en memoria."""
+    directorio = directorio or buscar_almacen()
+    with _cerrojo_cache:
+        _cache_indices.clear()
+        _ubicaciones.clear()
+    shutil.rmtree(os.path.join(directorio, DIRECTORIO_INDICES), ignore_errors=True)
+
+
+def imprimir_resumen(directorio=None):
+    """Resumen del catálogo leído solo del sidecar."""
+    metadatos = leer_metadatos(directorio)
+    columnas = metadatos['columnas']
+    print(f"✅ Dataset cargado: {metadatos['filas']:,} galaxias")
+    print(f"   VDISP: {columnas['VDISP']['min']:.1f}-{columnas['VDISP']['max']:.1f} km/s")
+    print(f"   Redshift: {columnas['Z']['min']:.3f}-{columnas['Z']['max']:.3f}")
+
+
+if __name__ == '__main__':
+    orden = sys.argv[1] if len(sys.argv) > 1 else 'resumen'
+    if orden == 'convertir':
+        ruta = convertir(*sys.argv[2:4])
+        print(f"✅ Almacén columnar escrito en {ruta}")
+        imprimir_resumen(ruta)
+    elif orden == 'resumen':
+        imprimir_resumen()
+    elif orden == 'limpiar-indices':
+        limpiar_indices()
+        print("✅ Índices de selección borrados")
+    else:
+        print(f"❌ Orden desconocida: {orden} (use 'convertir', 'resumen' o 'limpiar-indices')")
+        sys.exit(1)
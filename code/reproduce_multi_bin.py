@@ -1,8 +1,13 @@
+import os
+import sys
 import numpy as np
 from cosmic_vorticity import calcular_bispectro_triangular
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from catalogo_sdss import cargar_catalogo, valores_en_bin
+
 print("=== REPRODUCIENDO ANÁLISIS MULTI-BIN ===")
-data = np.load('../datasets/sdss_vdisp_calidad.npz')
+data = cargar_catalogo()
 
 bins = [
     (0.1, 0.2, 'z01_02'),
@@ -17,11 +22,10 @@ configs = [(2,2,2), (4,4,4)]
 print("Bispectro por bin de redshift (VDISP > 100):")
 results = {}
 for z_min, z_max, label in bins:
-    mask = (data['Z'] >= z_min) & (data['Z'] < z_max) & (data['VDISP'] > 100)
-    sample = data['VDISP'][mask][:150]
+    sample = valores_en_bin(data, z_min, z_max, corte_calidad=100, orden_original=True)[:150]
     
     if len(sample) > 0:
-        result = calcular_bispectro_triangular(sample.tolist(), l_max, configs)
+        result = calcular_bispectro_triangular(sample, l_max, configs)
         results[label] = result
         print(f'✅ {label} (z={z_min}-{z_max}): {result}')
     else:
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+SERVICIO DE CUANTILES DE VDISP
+
+Los cuantiles que definen los grupos de masa (Q33, Q66, deciles...) se piden para
+varios cortes de calidad sobre el mismo rango de redshift. En vez de materializar
+y ordenar la VDISP filtrada en cada consulta:
+
+- Exacto: la VDISP del tramo de Z se ordena una vez (y queda en la caché de índices
+  del catálogo, en memoria y en disco). Con VDISP > corte los valores son un sufijo
+  de ese arreglo (una búsqueda binaria) y cada percentil lineal se lee de dos
+  posiciones. Coincide bit a bit con np.percentile(..., method='linear') para q en
+  arreglo.
+- Aproximado: BocetoKLL, un boceto de cuantiles fusionable (tipo KLL) para datos
+  que llegan por bloques o no caben en memoria; error de rango del orden de 1/k.
+
+Uso:
+    from cuantiles import vdisp_ordenada, percentil_ordenado
+    vdisp_filtrada = vdisp_ordenada(catalogo, 0.1, 0.8, corte_calidad=150)
+    q_33, q_66 = percentil_ordenado(vdisp_filtrada, [33, 66])
+"""
+
+import numpy as np
+
+from catalogo_sdss import arreglo_en_cache, limite_en_dtype, texto_clave, tramo_z
+
+K_BOCETO = 200
+FACTOR_CAPACIDAD = 2.0 / 3.0
+BLOQUE_BOCETO = 1 << 20
+
+
+def vdisp_ordenada(datos, z_min, z_max, corte_calidad=None):
+    """VDISP ordenada (ascendente, sin NaN) de las filas con z_min <= Z < z_max y VDISP > corte_calidad.
+
+    El tramo ordenado se calcula una vez por rango de Z; el corte solo toma un sufijo
+    (vista de solo lectura, sin copia).
+    """
+    def ordenar():
+        inicio, fin = tramo_z(datos, z_min, z_max)
+        ordenados = np.sort(np.asarray(datos['VDISP'][inicio:fin]))
+        # np.sort deja los NaN al final; como en la máscara VDISP > corte, no cuentan
+        return ordenados[:len(ordenados) - np.count_nonzero(np.isnan(ordenados))]
+
+    nombre = f"vdisp_ordenada_z{texto_clave(z_min)}-{texto_clave(z_max)}"
+    ordenados = arreglo_en_cache(datos, nombre, ordenar)
+    if corte_calidad is None:
+        return ordenados
+    # El corte en el dtype de la columna, como en seleccionar_filas (y sin que searchsorted
+    # convierta el arreglo entero): VDISP > corte es el sufijo a la derecha del corte
+    corte = limite_en_dtype(ordenados, corte_calidad)
+    return ordenados[np.searchsorted(ordenados, corte, side='right'):]
+
+
+def percentil_ordenado(ordenados, percentiles):
+    """np.percentile(ordenados, percentiles) (método lineal) sobre datos ya ordenados, en O(1)
+    por percentil. Devuelve float64 (escalar si `percentiles` lo es)."""
+    if len(ordenados) == 0:
+        raise ValueError("percentil_ordenado: no hay datos")
+    q = np.asarray(percentiles, dtype=np.float64) / 100
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError("percentil_ordenado: los percentiles deben estar en [0, 100]")
+
+    # Mismo índice virtual e interpolación (simétrica en gamma = 0.5) que numpy
+    virtual = (len(ordenados) - 1) * q
+    previo = np.floor(virtual).astype(np.intp)
+    siguiente = np.minimum(previo + 1, len(ordenados) - 1)
+    gamma = virtual - previo
+    izquierda = ordenados[previo]
+    derecha = ordenados[siguiente]
+    diferencia = derecha - izquierda
+    resultado = np.where(gamma >= 0.5,
+                         derecha - diferencia * (1 - gamma),
+                         izquierda + diferencia * gamma).astype(np.float64)
+    return resultado[()] if resultado.ndim == 0 else resultado
+
+
+class BocetoKLL:
+    """Boceto de cuantiles fusionable (compactadores tipo KLL).
+
+    El nivel h guarda elementos de peso 2**h; cuando un nivel supera su capacidad
+    (k * (2/3)**(altura - 1 - h), mínimo 2) se ordena y la mitad de sus elementos,
+    tomados de uno en uno con desplazamiento aleatorio, suben al nivel siguiente.
+    La memoria es O(k) y el error de rango del orden de 1/k. `fusionar` une dos
+    bocetos nivel a nivel, de modo que bloques o procesos independientes se combinan
+    en un único resumen.
+    """
+
+    def __init__(self, k=K_BOCETO, semilla=None):
+        if k < 8:
+            raise ValueError("BocetoKLL: k debe ser al menos 8")
+        self.k = int(k)
+        self.n = 0
+        self._niveles = [np.empty(0)]
+        self._rng = np.random.default_rng(semilla)
+
+    def _capacidad(self, nivel):
+        altura = len(self._niveles)
+        return max(2, int(np.ceil(self.k * FACTOR_CAPACIDAD ** (altura - 1 - nivel))))
+
+    def _compactar(self):
+        # Mientras el total retenido supere la suma de capacidades se compacta el nivel
+        # más bajo que esté lleno (un nivel nuevo reduce la capacidad de los inferiores)
+        while self.retenidos > sum(self._capacidad(h) for h in range(len(self._niveles))):
+            nivel = next(h for h, e in enumerate(self._niveles) if len(e) >= self._capacidad(h))
+            if nivel + 1 == len(self._niveles):
+                self._niveles.append(np.empty(0))
+            elementos = np.sort(self._niveles[nivel])
+            # Con un número impar de elementos el mayor se queda en este nivel
+            n_pares = len(elementos) - len(elementos) % 2
+            desplazamiento = self._rng.integers(2)
+            self._niveles[nivel + 1] = np.concatenate(
+                (self._niveles[nivel + 1], elementos[desplazamiento:n_pares:2]))
+            self._niveles[nivel] = elementos[n_pares:]
+
+    def actualizar(self, valores):
+        """Añade un bloque de valores (los no finitos se ignoran)."""
+        valores = np.asarray(valores, dtype=np.float64).ravel()
+        valores = valores[np.isfinite(valores)]
+        if len(valores) == 0:
+            return self
+        self.n += len(valores)
+        self._niveles[0] = np.concatenate((self._niveles[0], valores))
+        self._compactar()
+        return self
+
+    def fusionar(self, otro):
+        """Incorpora otro boceto (el resultado resume la unión de ambos flujos)."""
+        while len(self._niveles) < len(otro._niveles):
+            self._niveles.append(np.empty(0))
+        for nivel, elementos in enumerate(otro._niveles):
+            self._niveles[nivel] = np.concatenate((self._niveles[nivel], elementos))
+        self.n += otro.n
+        self._compactar()
+        return self
+
+    def cuantiles(self, percentiles):
+        """Percentiles aproximados (0-100): elemento cuyo rango ponderado acumulado
+        alcanza q * n."""
+        if self.n == 0:
+            raise ValueError("BocetoKLL: boceto vacío")
+        valores = np.concatenate(self._niveles)
+        pesos = np.concatenate([np.full(len(e), 2.0 ** h) for h, e in enumerate(self._niveles)])
+        orden = np.argsort(valores, kind='stable')
+        valores = valores[orden]
+        acumulado = np.cumsum(pesos[orden])
+        q = np.asarray(percentiles, dtype=np.float64) / 100
+        posiciones = np.searchsorted(acumulado, q * acumulado[-1], side='left')
+        resultado = valores[np.minimum(posiciones, len(valores) - 1)]
+        return resultado[()] if resultado.ndim == 0 else resultado
+
+    @property
+    def retenidos(self):
+        """Elementos guardados (memoria del boceto)."""
+        return sum(len(e) for e in self._niveles)
+
+    def __repr__(self):
+        return f"BocetoKLL(k={self.k}, n={self.n}, retenidos={self.retenidos}, niveles={len(self._niveles)})"
+
+
+def boceto_vdisp(datos, z_min, z_max, corte_calidad=None, k=K_BOCETO, bloque=BLOQUE_BOCETO, semilla=None):
+    """BocetoKLL de la VDISP en z_min <= Z < z_max (y VDISP > corte_calidad), leyendo el
+    tramo del memmap por bloques de `bloque` filas: nunca se materializa el tramo entero."""
+    boceto = BocetoKLL(k, semilla)
+    inicio, fin = tramo_z(datos, z_min, z_max)
+    for desde in range(inicio, fin, bloque):
+        valores = np.asarray(datos['VDISP'][desde:min(desde + bloque, fin)])
+        if corte_calidad is not None:
+            valores = valores[valores > limite_en_dtype(valores, corte_calidad)]
+        boceto.actualizar(valores)
+    return boceto
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+EJECUTOR DE RÉPLICAS EN PARALELO
+
+Ejecuta funcion(tarea, rng) para cada réplica en un pool de hilos (por defecto) o
+de procesos, y devuelve los resultados en el orden de las tareas, sin importar el
+orden en que terminen. La réplica i recibe su propio Generator,
+muestreo.generador_replica(semilla, i): con la misma semilla el resultado es el
+mismo con 1 trabajador que con N.
+
+- Hilos: los núcleos de cosmic_vorticity liberan el GIL (py.allow_threads), así que
+  las réplicas corren de verdad en paralelo y comparten los memmaps del catálogo y
+  el pool de rayon. Es el modo que usan los scripts.
+- Procesos: para trabajo en Python puro. Usa 'forkserver' (un fork después de que
+  rayon haya arrancado sus hilos puede bloquearse), así que `funcion` debe vivir en
+  un módulo importable y el script lanzador debe protegerse con
+  if __name__ == '__main__'. Cada proceso limita RAYON_NUM_THREADS a su parte de
+  los núcleos.
+
+Un fallo en una réplica se propaga como ErrorReplica (con el índice de la réplica
+y la excepción original encadenada); las réplicas pendientes se cancelan.
+
+Uso:
+    from ejecutor import ejecutar_replicas
+    resultados = ejecutar_replicas(lambda replica, rng: calcular(replica, rng), 25, semilla=0)
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from muestreo import SEMILLA_REPLICAS, generadores_replicas
+
+VARIABLE_TRABAJADORES = 'COSMIC_TRABAJADORES'
+MODOS = ('hilos', 'procesos')
+
+
+class ErrorReplica(RuntimeError):
+    """Fallo de una réplica: `replica` es su índice y `tarea` lo que recibió."""
+
+    def __init__(self, replica, tarea, causa):
+        super().__init__(f"réplica {replica} ({tarea!r}) falló: {type(causa).__name__}: {causa}")
+        self.replica = replica
+        self.tarea = tarea
+
+
+def trabajadores_por_defecto():
+    """COSMIC_TRABAJADORES si está definida; si no, un trabajador por núcleo."""
+    valor = os.environ.get(VARIABLE_TRABAJADORES)
+    if valor:
+        return max(1, int(valor))
+    return os.cpu_count() or 1
+
+
+def _iniciar_proceso(hilos_rayon):
+    # Antes de importar cosmic_vorticity: el pool global de rayon lee la variable al crearse
+    os.environ.setdefault('RAYON_NUM_THREADS', str(hilos_rayon))
+
+
+def _ejecutar(funcion, tarea, rng):
+    return funcion(tarea, rng)
+
+
+def ejecutar_replicas(funcion, tareas, semilla=SEMILLA_REPLICAS, trabajadores=None, modo='hilos'):
+    """[funcion(tarea, rng_i) para cada tarea i], repartido entre `trabajadores`.
+
+    `tareas` es un entero n (las tareas son los índices 0..n-1) o una secuencia.
+    `semilla=None` toma entropía nueva, pero las réplicas siguen siendo flujos
+    independientes entre sí. Con un solo trabajador (o una sola tarea) se ejecuta en
+    el hilo actual, sin pool.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"ejecutar_replicas: modo '{modo}' desconocido (use {MODOS})")
+    tareas = list(range(tareas)) if isinstance(tareas, int) else list(tareas)
+    generadores = generadores_replicas(len(tareas), semilla)
+    trabajadores = min(trabajadores or trabajadores_por_defecto(), max(1, len(tareas)))
+
+    if trabajadores == 1:
+        resultados = []
+        for replica, (tarea, rng) in enumerate(zip(tareas, generadores)):
+            try:
+                resultados.append(funcion(tarea, rng))
+            except Exception as causa:
+                raise ErrorReplica(replica, tarea, causa) from causa
+        return resultados
+
+    if modo == 'hilos':
+        pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='replica')
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=trabajadores,
+            mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_iniciar_proceso,
+            initargs=(max(1, (os.cpu_count() or 1) // trabajadores),),
+        )
+
+    with pool:
+        futuros = [pool.submit(_ejecutar, funcion, tarea, rng) for tarea, rng in zip(tareas, generadores)]
+        resultados = []
+        # Se recogen en orden de réplica: el primer fallo (en ese orden) es el que se informa
+        for replica, (tarea, futuro) in enumerate(zip(tareas, futuros)):
+            try:
+                resultados.append(futuro.result())
+            except Exception as causa:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise ErrorReplica(replica, tarea, causa) from causa
+    return resultados
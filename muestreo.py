@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+MUESTREO SIN REEMPLAZO CON FLUJOS ALEATORIOS POR RÉPLICA
+
+np.random.choice(bin, size=500, replace=False) permuta el bin entero (cientos de
+miles de filas) para quedarse con 500, y np.random.seed(semilla) fija un estado
+global que impide ejecutar réplicas a la vez. Aquí:
+
+- indices_sin_reemplazo(n, k, rng): Fisher-Yates parcial disperso, O(k) en tiempo
+  y memoria (solo se guardan las posiciones intercambiadas).
+- Cada réplica tiene su propio Generator, hijo i-ésimo de SeedSequence(semilla):
+  el resultado de una réplica depende solo de (semilla, i), no del orden ni de la
+  concurrencia con que se ejecuten las demás.
+
+Uso:
+    from muestreo import generadores_replicas, muestra_sin_reemplazo
+    for rng in generadores_replicas(25, semilla=0):
+        sample = muestra_sin_reemplazo(galaxies_bin, 500, rng)
+"""
+
+import numpy as np
+
+SEMILLA_REPLICAS = 0
+
+
+def generador_replica(semilla, replica):
+    """Generator de la réplica `replica`: igual a SeedSequence(semilla).spawn(...)[replica],
+    pero construible en cualquier proceso a partir de (semilla, replica)."""
+    return np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(replica,)))
+
+
+def generadores_replicas(n_replicas, semilla=SEMILLA_REPLICAS):
+    """[generador_replica(semilla, i) for i in range(n_replicas)]. Con semilla=None la
+    entropía nueva se toma una sola vez, así que siguen siendo hijas de una SeedSequence."""
+    entropia = np.random.SeedSequence(semilla).entropy
+    return [generador_replica(entropia, replica) for replica in range(n_replicas)]
+
+
+def indices_sin_reemplazo(n, k, rng):
+    """k índices distintos de range(n), en orden aleatorio, en O(k).
+
+    Fisher-Yates parcial sobre una permutación virtual de range(n): en el paso i se
+    intercambia la posición i con una j uniforme en [i, n); el diccionario guarda solo
+    las posiciones que dejaron de valer su propio índice.
+    """
+    if not 0 <= k <= n:
+        raise ValueError(f"indices_sin_reemplazo: k={k} fuera de [0, {n}]")
+    destinos = rng.integers(np.arange(k), n)
+    intercambiadas = {}
+    indices = []
+    for i, j in enumerate(destinos.tolist()):
+        indices.append(intercambiadas.get(j, j))
+        intercambiadas[j] = intercambiadas.get(i, i)
+    return np.array(indices, dtype=np.int64)
+
+
+def muestra_sin_reemplazo(valores, k, rng):
+    """k elementos distintos (por posición) de `valores`, sin copiar el resto."""
+    return valores[indices_sin_reemplazo(len(valores), k, rng)]
+
+
+def muestras_replicas(valores, k, n_replicas, semilla=SEMILLA_REPLICAS):
+    """(n_replicas, k): la fila i es la muestra sin reemplazo de la réplica i."""
+    return np.stack([muestra_sin_reemplazo(valores, k, rng)
+                     for rng in generadores_replicas(n_replicas, semilla)])
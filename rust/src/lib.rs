@@ -1,7 +1,15 @@
+use numpy::ndarray::{s, Array2, Array3, ArrayView1, ArrayView2, ArrayView3, Axis};
+use numpy::{IntoPyArray, PyArray1, PyArray2, PyArray3, PyReadonlyArray1, PyReadonlyArray2, PyReadonlyArray3};
+use pyo3::exceptions::{PyIndexError, PyValueError};
 use pyo3::prelude::*;
+use rayon::prelude::*;
+use memmap2::Mmap;
+use std::borrow::Cow;
+use std::collections::HashMap;
 use std::f64::consts::PI;
-// ✅ Importación del crate real 'wigners'
-use wigners::wigner_3j; 
+use std::fs::File;
+use std::io::{self, Write};
+use std::sync::{Arc, Mutex, OnceLock, RwLock};
 
 
 // REEMPLAZAR la función #[pymodule] actual con esta:
@@ -9,232 +17,1893 @@ use wigners::wigner_3j;
 fn cosmic_vorticity(_py: Python, m: &PyModule) -> PyResult<()> {
     // Funciones originales
     m.add_function(wrap_pyfunction!(calcular_bispectro_triangular, m)?)?;
+    m.add_function(wrap_pyfunction!(calcular_bispectro_lote, m)?)?;
+    m.add_function(wrap_pyfunction!(calcular_bispectro_indices, m)?)?;
+    m.add_function(wrap_pyfunction!(calcular_bispectro_todos, m)?)?;
+    m.add_function(wrap_pyfunction!(evolucion_replicas, m)?)?;
+    m.add_function(wrap_pyfunction!(guardar_cache_wigner, m)?)?;
+    m.add_function(wrap_pyfunction!(cargar_cache_wigner, m)?)?;
+    m.add_function(wrap_pyfunction!(limpiar_cache_wigner, m)?)?;
+    m.add_function(wrap_pyfunction!(info_cache_wigner, m)?)?;
+    m.add_function(wrap_pyfunction!(establecer_hilos, m)?)?;
+    m.add_function(wrap_pyfunction!(hilos_actuales, m)?)?;
     m.add_function(wrap_pyfunction!(modelo_vorticidad_plasma, m)?)?;
+    m.add_function(wrap_pyfunction!(ajustar_vorticidad_plasma, m)?)?;
     m.add_function(wrap_pyfunction!(estadisticas_no_gaussianas, m)?)?;
+    m.add_class::<AcumuladorMomentos>()?;
 
     // NUEVAS FUNCIONES PARA GALAXIAS
     m.add_function(wrap_pyfunction!(generar_imagen_png, m)?)?;
     m.add_function(wrap_pyfunction!(generar_reporte_html, m)?)?;
     m.add_function(wrap_pyfunction!(exportar_datos_visualizacion, m)?)?;
     m.add_function(wrap_pyfunction!(analizar_morfologia_galaxia, m)?)?;
+    m.add_function(wrap_pyfunction!(analizar_morfologia_lote, m)?)?;
+    m.add_function(wrap_pyfunction!(armonicos_angulares, m)?)?;
     m.add_function(wrap_pyfunction!(calcular_patrones_lineas, m)?)?;
+    m.add_function(wrap_pyfunction!(calcular_patrones_lineas_lote, m)?)?;
+    m.add_function(wrap_pyfunction!(calcular_bispectro_2d, m)?)?;
 
     Ok(())
 }
 
+// Entradas por buffer: arreglos NumPy contiguos sin copia elemento a elemento.
+// Las listas de Python se siguen aceptando por compatibilidad con los scripts antiguos.
+
+#[derive(FromPyObject)]
+enum MuestraEntrada<'py> {
+    F32(PyReadonlyArray1<'py, f32>),
+    F64(PyReadonlyArray1<'py, f64>),
+    Lista(Vec<f32>),
+}
+
+impl<'py> MuestraEntrada<'py> {
+    /// Primeros `n` valores de la muestra como f32, completados con ceros si la muestra es
+    /// más corta (un coeficiente ausente vale 0). Un arreglo float32 contiguo con al menos
+    /// `n` valores se presta tal cual; en otro caso se copia solo ese prefijo.
+    fn prefijo(&self, n: usize) -> Cow<'_, [f32]> {
+        let prestado = match self {
+            MuestraEntrada::F32(arr) => arr.as_slice().ok(),
+            MuestraEntrada::F64(_) => None,
+            MuestraEntrada::Lista(datos) => Some(&datos[..]),
+        };
+        if let Some(datos) = prestado.filter(|datos| datos.len() >= n) {
+            return Cow::Borrowed(&datos[..n]);
+        }
+
+        let mut copia: Vec<f32> = match self {
+            MuestraEntrada::F32(arr) => arr.as_array().iter().take(n).copied().collect(),
+            MuestraEntrada::F64(arr) => arr.as_array().iter().take(n).map(|&x| x as f32).collect(),
+            MuestraEntrada::Lista(datos) => datos.iter().take(n).copied().collect(),
+        };
+        copia.resize(n, 0.0);
+        Cow::Owned(copia)
+    }
+}
+
+/// Vista de solo lectura de una columna, utilizable sin el GIL y con acceso aleatorio
+/// (cualquier paso, incluido un memmap).
+enum VistaCatalogo<'a> {
+    F32(ArrayView1<'a, f32>),
+    F64(ArrayView1<'a, f64>),
+    Lista(&'a [f32]),
+}
+
+impl<'a> VistaCatalogo<'a> {
+    fn len(&self) -> usize {
+        match self {
+            VistaCatalogo::F32(vista) => vista.len(),
+            VistaCatalogo::F64(vista) => vista.len(),
+            VistaCatalogo::Lista(datos) => datos.len(),
+        }
+    }
+
+    #[inline]
+    fn valor(&self, i: usize) -> f32 {
+        match self {
+            VistaCatalogo::F32(vista) => vista[i],
+            VistaCatalogo::F64(vista) => vista[i] as f32,
+            VistaCatalogo::Lista(datos) => datos[i],
+        }
+    }
+}
+
+impl<'py> MuestraEntrada<'py> {
+    fn vista(&self) -> VistaCatalogo<'_> {
+        match self {
+            MuestraEntrada::F32(arr) => VistaCatalogo::F32(arr.as_array()),
+            MuestraEntrada::F64(arr) => VistaCatalogo::F64(arr.as_array()),
+            MuestraEntrada::Lista(datos) => VistaCatalogo::Lista(datos),
+        }
+    }
+}
+
+#[derive(FromPyObject)]
+enum IndicesEntrada<'py> {
+    I64(PyReadonlyArray2<'py, i64>),
+    I32(PyReadonlyArray2<'py, i32>),
+}
+
+impl<'py> IndicesEntrada<'py> {
+    /// Primeras `n` columnas de cada fila como i64: (bloque, filas, ancho = min(n, columnas)).
+    fn prefijos(&self, n: usize) -> (Vec<i64>, usize, usize) {
+        fn copiar<T: Copy + Into<i64>>(filas: ArrayView2<'_, T>, n: usize) -> (Vec<i64>, usize, usize) {
+            let ancho = n.min(filas.ncols());
+            let mut bloque = Vec::with_capacity(filas.nrows() * ancho);
+            for fila in filas.outer_iter() {
+                bloque.extend(fila.iter().take(ancho).map(|&i| i.into()));
+            }
+            (bloque, filas.nrows(), ancho)
+        }
+
+        match self {
+            IndicesEntrada::I64(arr) => copiar(arr.as_array(), n),
+            IndicesEntrada::I32(arr) => copiar(arr.as_array(), n),
+        }
+    }
+}
+
+#[derive(FromPyObject)]
+enum MuestrasEntrada<'py> {
+    F32(PyReadonlyArray2<'py, f32>),
+    F64(PyReadonlyArray2<'py, f64>),
+}
+
+/// Prefijos de todas las réplicas de un lote: la fila `r` es `datos[r * paso..r * paso + ancho]`
+/// y tiene siempre `ancho` valores (completada con ceros si la réplica es más corta).
+struct ModosLote<'a> {
+    datos: Cow<'a, [f32]>,
+    paso: usize,
+    ancho: usize,
+    n_replicas: usize,
+}
+
+impl<'a> ModosLote<'a> {
+    fn fila(&self, r: usize) -> &[f32] {
+        &self.datos[r * self.paso..r * self.paso + self.ancho]
+    }
+}
+
+impl<'py> MuestrasEntrada<'py> {
+    /// Primeros `n` valores de cada réplica (fila). Un arreglo float32 C-contiguo con al
+    /// menos `n` columnas se presta completo; en otro caso se copian solo los prefijos a un
+    /// bloque compacto.
+    fn prefijos(&self, n: usize) -> ModosLote<'_> {
+        fn copiar<T: Copy>(
+            filas: ArrayView2<'_, T>,
+            n: usize,
+            a_f32: impl Fn(T) -> f32
+        ) -> ModosLote<'static> {
+            let mut datos = Vec::with_capacity(filas.nrows() * n);
+            for fila in filas.outer_iter() {
+                datos.extend(fila.iter().take(n).map(|&x| a_f32(x)));
+                datos.resize(datos.len() + n.saturating_sub(fila.len()), 0.0);
+            }
+            ModosLote { datos: Cow::Owned(datos), paso: n, ancho: n, n_replicas: filas.nrows() }
+        }
+
+        match self {
+            MuestrasEntrada::F32(arr) => {
+                let filas = arr.as_array();
+                match arr.as_slice() {
+                    Ok(datos) if filas.ncols() >= n => ModosLote {
+                        datos: Cow::Borrowed(datos),
+                        paso: filas.ncols(),
+                        ancho: n,
+                        n_replicas: filas.nrows(),
+                    },
+                    _ => copiar(filas, n, |x| x),
+                }
+            }
+            MuestrasEntrada::F64(arr) => copiar(arr.as_array(), n, |x| x as f32),
+        }
+    }
+}
+
+#[derive(FromPyObject)]
+enum ConfigsEntrada<'py> {
+    I64(PyReadonlyArray2<'py, i64>),
+    I32(PyReadonlyArray2<'py, i32>),
+    Lista(Vec<(u16, u16, u16)>),
+}
+
+impl<'py> ConfigsEntrada<'py> {
+    /// Convierte la entrada (lista de tuplas o arreglo (n, 3) entero) en triángulos (l1, l2, l3).
+    fn a_triangulos(&self) -> PyResult<Vec<(u16, u16, u16)>> {
+        fn desde_filas<T: Copy + Into<i64>>(
+            filas: ArrayView2<'_, T>
+        ) -> PyResult<Vec<(u16, u16, u16)>> {
+            if filas.ncols() != 3 {
+                return Err(PyValueError::new_err(format!(
+                    "configs debe tener forma (n, 3), recibido (n, {})", filas.ncols()
+                )));
+            }
+            filas.outer_iter().map(|fila| {
+                let l = |i: usize| {
+                    let valor: i64 = fila[i].into();
+                    u16::try_from(valor).map_err(|_| {
+                        PyValueError::new_err(format!("multipolo fuera de rango: {}", valor))
+                    })
+                };
+                Ok((l(0)?, l(1)?, l(2)?))
+            }).collect()
+        }
+
+        match self {
+            ConfigsEntrada::I64(arr) => desde_filas(arr.as_array()),
+            ConfigsEntrada::I32(arr) => desde_filas(arr.as_array()),
+            ConfigsEntrada::Lista(configs) => Ok(configs.clone()),
+        }
+    }
+}
+
+/// Número de coeficientes de la muestra que leen las configuraciones: (l_max_config + 1)².
+fn modos_necesarios(configs: &[(u16, u16, u16)]) -> usize {
+    configs.iter()
+        .map(|&(l1, l2, l3)| l1.max(l2).max(l3) as usize)
+        .max()
+        .map_or(0, |l| (l + 1) * (l + 1))
+}
+
+/// Bispectro de una muestra para cada configuración. `precision` es "rapida" (f32
+/// vectorizado) o "exacta" (f64 compensado); ver `Precision` para las cotas de error.
+/// `l_max` se conserva por compatibilidad: el índice l² + m + l no depende de él.
 #[pyfunction]
-fn calcular_bispectro_triangular(
-    modos_b: Vec<f32>,
+#[pyo3(signature = (modos_b, l_max, configs, precision = "rapida"))]
+fn calcular_bispectro_triangular<'py>(
+    py: Python<'py>,
+    modos_b: MuestraEntrada<'py>,
     l_max: u16,
-    configs: Vec<(u16, u16, u16)>
-) -> PyResult<Vec<f32>> {
-    let resultados: Vec<f32> = configs.iter()
-        .map(|&(l1, l2, l3)| calcular_bispectro_config(&modos_b, l1, l2, l3, l_max))
-        .collect();
-    Ok(resultados)
+    configs: ConfigsEntrada<'py>,
+    precision: &str
+) -> PyResult<&'py PyArray1<f64>> {
+    let _ = l_max;
+    let precision = Precision::desde_nombre(precision)?;
+    let configs = configs.a_triangulos()?;
+    // Solo se leen los coeficientes con índice l² + m + l <= (l_config_max + 1)² - 1
+    let modos = modos_b.prefijo(modos_necesarios(&configs));
+
+    let mut resultados = vec![0.0f64; configs.len()];
+    py.allow_threads(|| en_pool(|| rellenar_bispectros(&modos, &configs, precision, &mut resultados)));
+    Ok(resultados.into_pyarray(py))
+}
+
+/// Bispectros de un lote de réplicas (réplicas × galaxias) en una sola llamada.
+/// Devuelve una matriz réplicas × configuraciones; si se pasa `salida` (float64 C-contiguo
+/// de esa forma) se escribe ahí y se devuelve el mismo arreglo.
+#[pyfunction]
+#[pyo3(signature = (muestras, l_max, configs, salida = None, precision = "rapida"))]
+fn calcular_bispectro_lote<'py>(
+    py: Python<'py>,
+    muestras: MuestrasEntrada<'py>,
+    l_max: u16,
+    configs: ConfigsEntrada<'py>,
+    salida: Option<&'py PyArray2<f64>>,
+    precision: &str
+) -> PyResult<&'py PyArray2<f64>> {
+    let _ = l_max;
+    let precision = Precision::desde_nombre(precision)?;
+    let configs = configs.a_triangulos()?;
+    let modos = muestras.prefijos(modos_necesarios(&configs));
+    let salida = preparar_salida(py, salida, [modos.n_replicas, configs.len()])?;
+
+    let mut escritura = salida.try_readwrite()
+        .map_err(|e| PyValueError::new_err(format!("salida no escribible: {}", e)))?;
+    let destino = escritura.as_slice_mut()
+        .map_err(|_| PyValueError::new_err("salida debe ser C-contigua"))?;
+
+    py.allow_threads(|| en_pool(|| escribir_lote(&modos, &configs, precision, destino)));
+    Ok(salida)
+}
+
+/// Como `calcular_bispectro_lote`, pero cada réplica se arma dentro de Rust a partir de
+/// la columna completa `catalogo` (puede ser un memmap de solo lectura) y de una matriz
+/// `indices` de réplicas × tamaño de muestra: la fila r usa catalogo[indices[r, :]].
+/// Solo se leen los (l_max_config + 1)² primeros índices de cada fila, que son los únicos
+/// coeficientes que consume el núcleo; no se crea ninguna submuestra temporal en Python.
+#[pyfunction]
+#[pyo3(signature = (catalogo, indices, l_max, configs, salida = None, precision = "rapida"))]
+fn calcular_bispectro_indices<'py>(
+    py: Python<'py>,
+    catalogo: MuestraEntrada<'py>,
+    indices: IndicesEntrada<'py>,
+    l_max: u16,
+    configs: ConfigsEntrada<'py>,
+    salida: Option<&'py PyArray2<f64>>,
+    precision: &str
+) -> PyResult<&'py PyArray2<f64>> {
+    let _ = l_max;
+    let precision = Precision::desde_nombre(precision)?;
+    let configs = configs.a_triangulos()?;
+    let n = modos_necesarios(&configs);
+    let (indices, n_replicas, ancho) = indices.prefijos(n);
+    let salida = preparar_salida(py, salida, [n_replicas, configs.len()])?;
+
+    let mut escritura = salida.try_readwrite()
+        .map_err(|e| PyValueError::new_err(format!("salida no escribible: {}", e)))?;
+    let destino = escritura.as_slice_mut()
+        .map_err(|_| PyValueError::new_err("salida debe ser C-contigua"))?;
+
+    let catalogo = catalogo.vista();
+    py.allow_threads(|| en_pool(|| -> Result<(), i64> {
+        let modos = reunir_modos(&catalogo, &indices, n_replicas, ancho, n)?;
+        escribir_lote(&modos, &configs, precision, destino);
+        Ok(())
+    })).map_err(|indice: i64| PyIndexError::new_err(format!(
+        "índice {} fuera del catálogo ({} filas)", indice, catalogo.len()
+    )))?;
+    Ok(salida)
+}
+
+/// Arreglo de salida réplicas × configs: el que pasó el usuario (validado) o uno nuevo.
+fn preparar_salida<'py>(
+    py: Python<'py>,
+    salida: Option<&'py PyArray2<f64>>,
+    forma: [usize; 2]
+) -> PyResult<&'py PyArray2<f64>> {
+    match salida {
+        Some(arr) if arr.shape() != forma => Err(PyValueError::new_err(format!(
+            "salida debe tener forma {:?}, recibido {:?}", forma, arr.shape()
+        ))),
+        Some(arr) => Ok(arr),
+        None => Ok(PyArray2::zeros(py, forma, false)),
+    }
+}
+
+/// Bispectros de todas las réplicas de `modos` (en paralelo) sobre `destino` C-contiguo.
+fn escribir_lote(modos: &ModosLote, configs: &[(u16, u16, u16)], precision: Precision, destino: &mut [f64]) {
+    if configs.is_empty() {
+        return;
+    }
+    destino.par_chunks_mut(configs.len()).enumerate().for_each(|(r, fila_salida)| {
+        rellenar_bispectros(modos.fila(r), configs, precision, fila_salida);
+    });
+}
+
+/// Arma el bloque de prefijos réplicas × `n` leyendo `catalogo` en los índices dados
+/// (`indices` es réplicas × `ancho`, con `ancho` <= `n`; el resto queda en cero).
+/// Devuelve el primer índice fuera de rango como error.
+fn reunir_modos(
+    catalogo: &VistaCatalogo,
+    indices: &[i64],
+    n_replicas: usize,
+    ancho: usize,
+    n: usize
+) -> Result<ModosLote<'static>, i64> {
+    let mut datos = vec![0.0f32; n_replicas * n];
+    if n > 0 {
+        let largo = catalogo.len();
+        datos.par_chunks_mut(n).enumerate().try_for_each(|(r, fila)| {
+            for (destino, &indice) in fila.iter_mut().zip(&indices[r * ancho..(r + 1) * ancho]) {
+                if indice < 0 || indice as usize >= largo {
+                    return Err(indice);
+                }
+                *destino = catalogo.valor(indice as usize);
+            }
+            Ok(())
+        })?;
+    }
+    Ok(ModosLote { datos: Cow::Owned(datos), paso: n, ancho: n, n_replicas })
+}
+
+/// Escribe en `salida[i]` el bispectro de `configs[i]` para una muestra (configs en paralelo).
+/// `modos_b` debe cubrir (l_max_config + 1)² coeficientes (ver `modos_necesarios`).
+fn rellenar_bispectros(
+    modos_b: &[f32],
+    configs: &[(u16, u16, u16)],
+    precision: Precision,
+    salida: &mut [f64]
+) {
+    salida.par_iter_mut().zip(configs.par_iter()).for_each(|(destino, &(l1, l2, l3))| {
+        *destino = calcular_bispectro_config(modos_b, l1, l2, l3, precision);
+    });
+}
+
+// Pool de hilos del módulo. Sin configurar se usa el pool global de rayon
+// (un hilo por núcleo o RAYON_NUM_THREADS); `establecer_hilos` lo sustituye.
+
+fn pool_hilos() -> &'static RwLock<Option<Arc<rayon::ThreadPool>>> {
+    static POOL: OnceLock<RwLock<Option<Arc<rayon::ThreadPool>>>> = OnceLock::new();
+    POOL.get_or_init(|| RwLock::new(None))
+}
+
+/// Ejecuta `trabajo` dentro del pool configurado del módulo.
+fn en_pool<R: Send>(trabajo: impl FnOnce() -> R + Send) -> R {
+    let pool = pool_hilos().read().unwrap_or_else(|e| e.into_inner()).clone();
+    match pool {
+        Some(pool) => pool.install(trabajo),
+        None => trabajo(),
+    }
+}
+
+/// Fija el número de hilos de los núcleos paralelos; 0 vuelve al pool global de rayon.
+/// Devuelve el número de hilos efectivo.
+#[pyfunction]
+fn establecer_hilos(n_hilos: usize) -> PyResult<usize> {
+    let nuevo = if n_hilos == 0 {
+        None
+    } else {
+        let pool = rayon::ThreadPoolBuilder::new()
+            .num_threads(n_hilos)
+            .thread_name(|i| format!("cosmic-vorticity-{}", i))
+            .build()
+            .map_err(|e| PyValueError::new_err(format!("no se pudo crear el pool: {}", e)))?;
+        Some(Arc::new(pool))
+    };
+    *pool_hilos().write().unwrap_or_else(|e| e.into_inner()) = nuevo;
+    Ok(hilos_actuales())
+}
+
+/// Número de hilos que usarán los núcleos paralelos.
+#[pyfunction]
+fn hilos_actuales() -> usize {
+    match &*pool_hilos().read().unwrap_or_else(|e| e.into_inner()) {
+        Some(pool) => pool.current_num_threads(),
+        None => rayon::current_num_threads(),
+    }
+}
+
+// Modelo de vorticidad de plasma f(x) = A·sin(x)·exp(-b·x) sobre la malla
+// x_i = 2π·i / n_puntos, i = 0..n_puntos.
+
+/// Un vector o una matriz float64 con una fila por modelo o perfil (parámetros del modelo,
+/// errores de un ajuste).
+#[derive(FromPyObject)]
+enum FilasEntrada<'py> {
+    Matriz(PyReadonlyArray2<'py, f64>),
+    Vector(Vec<f64>),
+}
+
+/// Malla x_i y sin(x_i) del modelo, compartida por todos los modelos de una llamada.
+fn malla_vorticidad(n_puntos: usize) -> (Vec<f64>, Vec<f64>) {
+    let x: Vec<f64> = (0..n_puntos).map(|i| i as f64 / n_puntos as f64 * 2.0 * PI).collect();
+    let seno = x.iter().map(|x| x.sin()).collect();
+    (x, seno)
+}
+
+/// Escribe A·sin(x)·exp(-b·x) en `salida` sobre la malla (`x`, `seno`).
+fn evaluar_vorticidad(a: f64, b: f64, x: &[f64], seno: &[f64], salida: &mut [f64]) {
+    for ((destino, &x), &s) in salida.iter_mut().zip(x).zip(seno) {
+        *destino = a * s * (-b * x).exp();
+    }
+}
+
+/// Evalúa el modelo A·sin(x)·exp(-b·x) en `n_puntos` puntos de [0, 2π).
+///
+/// Con un vector de parámetros (A, b) devuelve un arreglo 1-D; con una matriz
+/// n_modelos × n_parametros (columnas A, b; las demás se ignoran) devuelve
+/// n_modelos × n_puntos, con los modelos en paralelo. Pensado para barridos de
+/// verosimilitud sobre rejillas de parámetros.
+#[pyfunction]
+fn modelo_vorticidad_plasma(
+    py: Python<'_>,
+    parametros: FilasEntrada<'_>,
+    n_puntos: u64
+) -> PyResult<PyObject> {
+    let n_puntos = usize::try_from(n_puntos)
+        .map_err(|_| PyValueError::new_err("n_puntos no cabe en memoria"))?;
+    let (x, seno) = malla_vorticidad(n_puntos);
+
+    match parametros {
+        FilasEntrada::Vector(parametros) => {
+            if parametros.len() < 2 {
+                return Err(PyValueError::new_err("parametros debe contener (A, b)"));
+            }
+            let mut salida = vec![0.0f64; n_puntos];
+            evaluar_vorticidad(parametros[0], parametros[1], &x, &seno, &mut salida);
+            Ok(salida.into_pyarray(py).into())
+        }
+        FilasEntrada::Matriz(matriz) => {
+            let matriz = matriz.as_array();
+            if matriz.ncols() < 2 {
+                return Err(PyValueError::new_err("parametros debe tener al menos las columnas (A, b)"));
+            }
+            let mut salida = vec![0.0f64; matriz.nrows() * n_puntos];
+            if n_puntos > 0 {
+                py.allow_threads(|| en_pool(|| {
+                    salida.par_chunks_mut(n_puntos).enumerate().for_each(|(i, fila)| {
+                        evaluar_vorticidad(matriz[[i, 0]], matriz[[i, 1]], &x, &seno, fila);
+                    });
+                }));
+            }
+            let salida = Array2::from_shape_vec((matriz.nrows(), n_puntos), salida)
+                .expect("n_modelos × n_puntos");
+            Ok(salida.into_pyarray(py).into())
+        }
+    }
+}
+
+// Ajuste por mínimos cuadrados (Levenberg–Marquardt) del modelo A·sin(x)·exp(-b·x), con
+// el jacobiano analítico
+//   ∂f/∂A = sin(x)·exp(-b·x),   ∂f/∂b = -x·A·sin(x)·exp(-b·x).
+// Con dos parámetros las ecuaciones normales son 2×2 y se resuelven en forma cerrada.
+
+/// Valores de b con los que se busca el punto de partida cuando no se da `p0`.
+const B_INICIALES: [f64; 9] = [-1.0, -0.5, 0.0, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0];
+
+/// Resultado del ajuste de un perfil.
+struct AjusteVorticidad {
+    parametros: [f64; 2],
+    covarianza: [[f64; 2]; 2],
+    chi2: f64,
+    convergido: bool,
+}
+
+/// χ² ponderado, JᵀWJ y JᵀW·r del modelo con (a, b) sobre el perfil `y`.
+fn sistema_vorticidad(
+    a: f64,
+    b: f64,
+    x: &[f64],
+    seno: &[f64],
+    y: &[f64],
+    peso: &[f64]
+) -> (f64, [[f64; 2]; 2], [f64; 2]) {
+    let (mut chi2, mut jtj, mut jtr) = (0.0, [[0.0f64; 2]; 2], [0.0f64; 2]);
+    for i in 0..y.len() {
+        let base = seno[i] * (-b * x[i]).exp();
+        let residuo = y[i] - a * base;
+        let (ja, jb) = (base, -x[i] * a * base);
+        chi2 += peso[i] * residuo * residuo;
+        jtj[0][0] += peso[i] * ja * ja;
+        jtj[0][1] += peso[i] * ja * jb;
+        jtj[1][1] += peso[i] * jb * jb;
+        jtr[0] += peso[i] * ja * residuo;
+        jtr[1] += peso[i] * jb * residuo;
+    }
+    jtj[1][0] = jtj[0][1];
+    (chi2, jtj, jtr)
+}
+
+/// Inversa de una matriz simétrica 2×2 (None si es singular).
+fn invertir_2x2(m: [[f64; 2]; 2]) -> Option<[[f64; 2]; 2]> {
+    let det = m[0][0] * m[1][1] - m[0][1] * m[1][0];
+    if !det.is_finite() || det.abs() <= f64::EPSILON * (m[0][0] * m[1][1]).abs() {
+        return None;
+    }
+    Some([[m[1][1] / det, -m[0][1] / det], [-m[1][0] / det, m[0][0] / det]])
+}
+
+/// Punto de partida: para cada b de `B_INICIALES`, la A óptima (lineal) y su χ²; gana el menor.
+fn inicio_vorticidad(x: &[f64], seno: &[f64], y: &[f64], peso: &[f64]) -> [f64; 2] {
+    B_INICIALES.iter().map(|&b| {
+        let (mut num, mut den) = (0.0, 0.0);
+        for i in 0..y.len() {
+            let base = seno[i] * (-b * x[i]).exp();
+            num += peso[i] * y[i] * base;
+            den += peso[i] * base * base;
+        }
+        let a = if den > 0.0 { num / den } else { 0.0 };
+        (sistema_vorticidad(a, b, x, seno, y, peso).0, [a, b])
+    })
+    .filter(|(chi2, _)| chi2.is_finite())
+    .min_by(|p, q| p.0.total_cmp(&q.0))
+    .map_or([0.0, 0.0], |(_, inicio)| inicio)
+}
+
+/// Ajusta un perfil. `peso` = 1/σ² por punto; sin σ conocidas (`escalar_covarianza`) la
+/// covarianza se escala con χ²/(n - 2), como `curve_fit` con `absolute_sigma=False`.
+fn ajustar_perfil_vorticidad(
+    x: &[f64],
+    seno: &[f64],
+    y: &[f64],
+    peso: &[f64],
+    p0: Option<[f64; 2]>,
+    max_iter: usize,
+    tol: f64,
+    escalar_covarianza: bool
+) -> AjusteVorticidad {
+    let [mut a, mut b] = p0.unwrap_or_else(|| inicio_vorticidad(x, seno, y, peso));
+    let (mut chi2, mut jtj, mut jtr) = sistema_vorticidad(a, b, x, seno, y, peso);
+    let mut lambda = 1e-3;
+    let mut convergido = false;
+
+    for _ in 0..max_iter {
+        let amortiguada = [
+            [jtj[0][0] * (1.0 + lambda), jtj[0][1]],
+            [jtj[1][0], jtj[1][1] * (1.0 + lambda)],
+        ];
+        let paso = match invertir_2x2(amortiguada) {
+            Some(inv) => [
+                inv[0][0] * jtr[0] + inv[0][1] * jtr[1],
+                inv[1][0] * jtr[0] + inv[1][1] * jtr[1],
+            ],
+            None => {
+                lambda *= 10.0;
+                if lambda > 1e16 {
+                    break;
+                }
+                continue;
+            }
+        };
+        let (a_nuevo, b_nuevo) = (a + paso[0], b + paso[1]);
+        let (chi2_nuevo, jtj_nuevo, jtr_nuevo) = sistema_vorticidad(a_nuevo, b_nuevo, x, seno, y, peso);
+        if chi2_nuevo.is_finite() && chi2_nuevo <= chi2 {
+            let mejora = chi2 - chi2_nuevo;
+            let paso_relativo = (paso[0].abs() / (a.abs() + tol)).max(paso[1].abs() / (b.abs() + tol));
+            (a, b, chi2, jtj, jtr) = (a_nuevo, b_nuevo, chi2_nuevo, jtj_nuevo, jtr_nuevo);
+            lambda = (lambda / 10.0).max(1e-12);
+            if mejora <= tol * chi2.max(f64::MIN_POSITIVE) || paso_relativo <= tol {
+                convergido = true;
+                break;
+            }
+        } else {
+            lambda *= 10.0;
+            if lambda > 1e16 {
+                // Ningún paso reduce χ²: se está en el mínimo a precisión de máquina
+                convergido = jtr[0].abs() + jtr[1].abs() <= tol.sqrt() * (1.0 + chi2);
+                break;
+            }
+        }
+    }
+
+    let libertad = y.len().saturating_sub(2);
+    let escala = if escalar_covarianza {
+        if libertad > 0 { chi2 / libertad as f64 } else { f64::NAN }
+    } else {
+        1.0
+    };
+    let covarianza = invertir_2x2(jtj)
+        .map(|inv| [[inv[0][0] * escala, inv[0][1] * escala], [inv[1][0] * escala, inv[1][1] * escala]])
+        .unwrap_or([[f64::NAN; 2]; 2]);
+    AjusteVorticidad { parametros: [a, b], covarianza, chi2, convergido }
+}
+
+/// Ajusta A·sin(x)·exp(-b·x) a cada fila de `perfiles` (n_perfiles × n_puntos) por
+/// Levenberg–Marquardt con jacobiano analítico, perfiles en paralelo.
+///
+/// `x` es la abscisa común (por defecto la malla de `modelo_vorticidad_plasma`); `sigma`
+/// los errores, por punto (1-D) o por perfil y punto (2-D). `p0` = (A, b) inicial; sin él
+/// se parte del mejor b de una rejilla corta con A lineal óptima. Devuelve
+/// `(parametros (n, 2), covarianzas (n, 2, 2), chi2 (n,), convergido (n,))`; sin `sigma`
+/// la covarianza se escala con χ²/(n_puntos - 2).
+#[pyfunction]
+#[pyo3(signature = (perfiles, x = None, sigma = None, p0 = None, max_iter = 200, tol = 1e-10))]
+fn ajustar_vorticidad_plasma<'py>(
+    py: Python<'py>,
+    perfiles: PyReadonlyArray2<'py, f64>,
+    x: Option<PyReadonlyArray1<'py, f64>>,
+    sigma: Option<FilasEntrada<'py>>,
+    p0: Option<(f64, f64)>,
+    max_iter: usize,
+    tol: f64
+) -> PyResult<(&'py PyArray2<f64>, &'py PyArray3<f64>, &'py PyArray1<f64>, &'py PyArray1<bool>)> {
+    let perfiles = perfiles.as_array();
+    let (n_perfiles, n_puntos) = perfiles.dim();
+    let (x, seno) = match &x {
+        Some(x) => {
+            let x = x.as_array().to_vec();
+            if x.len() != n_puntos {
+                return Err(PyValueError::new_err(format!(
+                    "x tiene {} puntos y los perfiles {}", x.len(), n_puntos
+                )));
+            }
+            let seno = x.iter().map(|x| x.sin()).collect();
+            (x, seno)
+        }
+        None => malla_vorticidad(n_puntos),
+    };
+
+    // Pesos 1/σ²: una fila común o una por perfil
+    let (pesos, paso_pesos) = match &sigma {
+        None => (vec![1.0; n_puntos], 0),
+        Some(FilasEntrada::Vector(sigma)) if sigma.len() == n_puntos => {
+            (sigma.iter().map(|s| 1.0 / (s * s)).collect(), 0)
+        }
+        Some(FilasEntrada::Matriz(sigma)) if sigma.as_array().dim() == (n_perfiles, n_puntos) => {
+            (sigma.as_array().iter().map(|s| 1.0 / (s * s)).collect(), n_puntos)
+        }
+        Some(_) => {
+            return Err(PyValueError::new_err(
+                "sigma debe tener n_puntos valores o la forma de perfiles"
+            ));
+        }
+    };
+    let escalar_covarianza = sigma.is_none();
+    let p0 = p0.map(|(a, b)| [a, b]);
+
+    let ajustes: Vec<AjusteVorticidad> = py.allow_threads(|| en_pool(|| {
+        (0..n_perfiles).into_par_iter().map(|i| {
+            let fila = perfiles.row(i);
+            let y: Cow<[f64]> = match fila.as_slice() {
+                Some(y) => Cow::Borrowed(y),
+                None => Cow::Owned(fila.to_vec()),
+            };
+            let peso = &pesos[i * paso_pesos..i * paso_pesos + n_puntos];
+            ajustar_perfil_vorticidad(&x, &seno, &y, peso, p0, max_iter, tol, escalar_covarianza)
+        }).collect()
+    }));
+
+    let parametros: Vec<f64> = ajustes.iter().flat_map(|a| a.parametros).collect();
+    let covarianzas: Vec<f64> = ajustes.iter().flat_map(|a| a.covarianza.into_iter().flatten()).collect();
+    let chi2: Vec<f64> = ajustes.iter().map(|a| a.chi2).collect();
+    let convergido: Vec<bool> = ajustes.iter().map(|a| a.convergido).collect();
+    Ok((
+        Array2::from_shape_vec((n_perfiles, 2), parametros).expect("n × 2").into_pyarray(py),
+        Array3::from_shape_vec((n_perfiles, 2, 2), covarianzas).expect("n × 2 × 2").into_pyarray(py),
+        chi2.into_pyarray(py),
+        convergido.into_pyarray(py),
+    ))
+}
+
+// Momentos centrales en una pasada y fusionables (Pébay 2008): cada bloque se resume en
+// (n, media, M2, M3, M4) con Mk = Σ (x - media)^k, y dos resúmenes se combinan de forma
+// exacta. Así una columna se procesa por bloques (o por hilos, o por archivos) sin copiarla.
+
+/// Valores por bloque al resumir un arreglo; los bloques se reparten entre hilos.
+const BLOQUE_MOMENTOS: usize = 8192;
+
+#[derive(Clone, Copy, Debug, Default, PartialEq)]
+struct Momentos {
+    n: u64,
+    media: f64,
+    m2: f64,
+    m3: f64,
+    m4: f64,
+}
+
+impl Momentos {
+    /// Resumen de un bloque en dos pasadas (media y luego sumas centrales) sobre datos en caché.
+    fn de_valores<I: Iterator<Item = f64> + Clone>(valores: I) -> Momentos {
+        let (n, suma) = valores.clone().fold((0u64, 0.0f64), |(n, s), x| (n + 1, s + x));
+        if n == 0 {
+            return Momentos::default();
+        }
+        let media = suma / n as f64;
+        let (m2, m3, m4) = valores.fold((0.0, 0.0, 0.0), |(m2, m3, m4), x| {
+            let d = x - media;
+            let d2 = d * d;
+            (m2 + d2, m3 + d2 * d, m4 + d2 * d2)
+        });
+        Momentos { n, media, m2, m3, m4 }
+    }
+
+    /// Resumen de los elementos `inicio..fin` de una vista.
+    fn de_tramo(vista: &VistaCatalogo, inicio: usize, fin: usize) -> Momentos {
+        match vista {
+            VistaCatalogo::F32(v) => Momentos::de_valores(v.slice(s![inicio..fin]).iter().map(|&x| x as f64)),
+            VistaCatalogo::F64(v) => Momentos::de_valores(v.slice(s![inicio..fin]).iter().copied()),
+            VistaCatalogo::Lista(datos) => Momentos::de_valores(datos[inicio..fin].iter().map(|&x| x as f64)),
+        }
+    }
+
+    /// Resumen de una vista completa: bloques en paralelo, fusionados en orden para que el
+    /// resultado no dependa del número de hilos.
+    fn de_vista(vista: &VistaCatalogo) -> Momentos {
+        let n = vista.len();
+        let bloques: Vec<Momentos> = (0..n.div_ceil(BLOQUE_MOMENTOS)).into_par_iter().map(|b| {
+            let inicio = b * BLOQUE_MOMENTOS;
+            Momentos::de_tramo(vista, inicio, (inicio + BLOQUE_MOMENTOS).min(n))
+        }).collect();
+        bloques.iter().fold(Momentos::default(), |total, bloque| total.fusionar(bloque))
+    }
+
+    /// Combina dos resúmenes como si se hubieran calculado sobre la unión de los datos.
+    fn fusionar(&self, otro: &Momentos) -> Momentos {
+        if otro.n == 0 {
+            return *self;
+        }
+        if self.n == 0 {
+            return *otro;
+        }
+        let (na, nb) = (self.n as f64, otro.n as f64);
+        let n = na + nb;
+        let delta = otro.media - self.media;
+        let (d2, d_n) = (delta * delta, delta / n);
+        let m2 = self.m2 + otro.m2 + d2 * na * nb / n;
+        let m3 = self.m3 + otro.m3
+            + d2 * d_n * na * nb * (na - nb) / n
+            + 3.0 * d_n * (na * otro.m2 - nb * self.m2);
+        let m4 = self.m4 + otro.m4
+            + d2 * d_n * d_n * na * nb * (na * na - na * nb + nb * nb) / n
+            + 6.0 * d_n * d_n * (na * na * otro.m2 + nb * nb * self.m2)
+            + 4.0 * d_n * (na * otro.m3 - nb * self.m3);
+        Momentos { n: self.n + otro.n, media: self.media + d_n * nb, m2, m3, m4 }
+    }
+
+    /// [media, varianza, asimetría, curtosis en exceso] (momentos poblacionales).
+    fn estadisticas(&self) -> Vec<f64> {
+        let n = self.n as f64;
+        let varianza = self.m2 / n;
+        if self.n == 0 || varianza <= 0.0 {
+            return vec![if self.n == 0 { f64::NAN } else { self.media }, varianza, 0.0, 0.0];
+        }
+        let asimetria = (self.m3 / n) / varianza.powf(1.5);
+        let curtosis = (self.m4 / n) / (varianza * varianza) - 3.0;
+        vec![self.media, varianza, asimetria, curtosis]
+    }
+}
+
+/// Acumulador de momentos por bloques.
+///
+/// `actualizar` admite arreglos float32/float64 (incluidos memory-maps y rebanadas, sin
+/// copia) o listas; `fusionar` combina acumuladores de otros bloques, hilos o procesos;
+/// `estado` / `desde_estado` exponen el resumen (n, media, M2, M3, M4) para guardarlo o
+/// enviarlo. `resultado` devuelve lo mismo que `estadisticas_no_gaussianas`.
+#[pyclass(module = "cosmic_vorticity")]
+#[derive(Clone, Default)]
+struct AcumuladorMomentos {
+    momentos: Momentos,
+}
+
+#[pymethods]
+impl AcumuladorMomentos {
+    #[new]
+    fn new() -> Self {
+        AcumuladorMomentos::default()
+    }
+
+    /// Añade un bloque de valores.
+    fn actualizar(&mut self, py: Python<'_>, datos: MuestraEntrada<'_>) {
+        let vista = datos.vista();
+        let bloque = py.allow_threads(|| en_pool(|| Momentos::de_vista(&vista)));
+        self.momentos = self.momentos.fusionar(&bloque);
+    }
+
+    /// Incorpora el contenido de otro acumulador (el otro no se modifica).
+    fn fusionar(slf: &PyCell<Self>, otro: &PyCell<Self>) {
+        let otro = otro.borrow().momentos;
+        let mut acumulador = slf.borrow_mut();
+        acumulador.momentos = acumulador.momentos.fusionar(&otro);
+    }
+
+    /// (n, media, M2, M3, M4)
+    fn estado(&self) -> (u64, f64, f64, f64, f64) {
+        let m = &self.momentos;
+        (m.n, m.media, m.m2, m.m3, m.m4)
+    }
+
+    #[staticmethod]
+    fn desde_estado(estado: (u64, f64, f64, f64, f64)) -> Self {
+        let (n, media, m2, m3, m4) = estado;
+        AcumuladorMomentos { momentos: Momentos { n, media, m2, m3, m4 } }
+    }
+
+    /// [media, varianza, asimetria, curtosis]
+    fn resultado(&self) -> Vec<f64> {
+        self.momentos.estadisticas()
+    }
+
+    #[getter]
+    fn n(&self) -> u64 {
+        self.momentos.n
+    }
+
+    fn __reduce__(&self, py: Python<'_>) -> PyResult<(PyObject, ((u64, f64, f64, f64, f64),))> {
+        let constructor = py.get_type::<Self>().getattr("desde_estado")?;
+        Ok((constructor.into(), (self.estado(),)))
+    }
+
+    fn __repr__(&self) -> String {
+        let m = &self.momentos;
+        format!("AcumuladorMomentos(n={}, media={})", m.n, m.media)
+    }
+}
+
+/// [media, varianza, asimetría, curtosis en exceso] de una columna, en una pasada por
+/// bloques en paralelo y en f64. Acepta arreglos float32/float64 sin copiarlos.
+#[pyfunction]
+fn estadisticas_no_gaussianas(py: Python<'_>, datos: MuestraEntrada<'_>) -> PyResult<Vec<f64>> {
+    let vista = datos.vista();
+    let momentos = py.allow_threads(|| en_pool(|| Momentos::de_vista(&vista)));
+    Ok(momentos.estadisticas())
+}
+
+fn condiciones_triangulo(l1: u16, l2: u16, l3: u16) -> bool {
+    // En u32 para que l1 + l2 + l3 no desborde con multipolos altos
+    let (l1, l2, l3) = (l1 as u32, l2 as u32, l3 as u32);
+    (l1 + l2 >= l3) && (l1 + l3 >= l2) && (l2 + l3 >= l1) &&
+    (l1 + l2 + l3) % 2 == 0 
+}
+
+/// Umbral de reescalado de la recurrencia 3j (evita desbordes con l del orden de miles).
+const ENORME_3J: f64 = 1e150;
+
+/// Fila m1 de símbolos 3j (l1 l2 l3; m1 m2 -m1-m2) para m2 = m2_min..=m2_max, por la
+/// recurrencia de tres términos en m2 de Schulten–Gordon:
+///
+///   C(m2 + 1)·f(m2 + 1) + D(m2)·f(m2) + C(m2)·f(m2 - 1) = 0,  m3 = -m1 - m2
+///   C(m) = √((l2 - m + 1)(l2 + m)(l3 + m3 + 1)(l3 - m3))
+///   D(m) = l2(l2 + 1) + l3(l3 + 1) - l1(l1 + 1) + 2·m·m3
+///
+/// Se recurre hacia delante desde m2_min hasta el primer máximo local de |f| y hacia atrás
+/// desde m2_max hasta ese punto (cada sentido avanza donde la solución crece, que es el
+/// sentido estable), se empalman por mínimos cuadrados sobre los puntos comunes y se
+/// normaliza con (2l1 + 1)·Σ f² = 1 y sgn f(m2_max) = (-1)^(l2 - l3 - m1).
+/// Frente a la fórmula de Racah exacta: error absoluto ~1e-15 para l < 16 y ~1e-13
+/// relativo hasta l = 300.
+fn fila_wigner_3j(l1: u16, l2: u16, l3: u16, m1: isize, fila: &mut [f64], auxiliar: &mut Vec<f64>) {
+    let (j1, j2, j3) = (l1 as f64, l2 as f64, l3 as f64);
+    let (l2i, l3i) = (l2 as isize, l3 as isize);
+    let m2_min = (-l2i).max(-l3i - m1);
+    let m2_max = l2i.min(l3i - m1);
+    let n = fila.len();
+    debug_assert_eq!(n as isize, m2_max - m2_min + 1);
+
+    let signo = if (l2i - l3i - m1).rem_euclid(2) == 0 { 1.0 } else { -1.0 };
+    if n == 1 {
+        fila[0] = signo / (2.0 * j1 + 1.0).sqrt();
+        return;
+    }
+
+    let c = |m: isize| {
+        let (m, m3) = (m as f64, (-m1 - m) as f64);
+        ((j2 - m + 1.0) * (j2 + m) * (j3 + m3 + 1.0) * (j3 - m3)).max(0.0).sqrt()
+    };
+    let d = |m: isize| {
+        let m3 = (-m1 - m) as f64;
+        j2 * (j2 + 1.0) + j3 * (j3 + 1.0) - j1 * (j1 + 1.0) + 2.0 * m as f64 * m3
+    };
+
+    // Hacia delante hasta que |f| deja de crecer (índice `corte`) o hasta el final
+    fila[0] = 1.0;
+    fila[1] = -d(m2_min) * fila[0] / c(m2_min + 1);
+    let mut corte = n;
+    let mut i = 1;
+    loop {
+        if fila[i].abs() < fila[i - 1].abs() {
+            corte = i;
+            break;
+        }
+        if i == n - 1 {
+            break;
+        }
+        let m = m2_min + i as isize;
+        fila[i + 1] = -(d(m) * fila[i] + c(m) * fila[i - 1]) / c(m + 1);
+        i += 1;
+        if fila[i].abs() > ENORME_3J {
+            fila[..=i].iter_mut().for_each(|f| *f /= ENORME_3J);
+        }
+    }
+
+    if corte < n {
+        // Hacia atrás desde m2_max hasta `corte - 2` y empalme en los puntos comunes
+        auxiliar.clear();
+        auxiliar.resize(n, 0.0);
+        let g = &mut auxiliar[..];
+        g[n - 1] = 1.0;
+        g[n - 2] = -d(m2_max) * g[n - 1] / c(m2_max);
+        let desde = corte.saturating_sub(2);
+        let mut i = n - 2;
+        while i > desde {
+            let m = m2_min + i as isize;
+            g[i - 1] = -(d(m) * g[i] + c(m + 1) * g[i + 1]) / c(m);
+            i -= 1;
+            if g[i].abs() > ENORME_3J {
+                g[i..].iter_mut().for_each(|x| *x /= ENORME_3J);
+            }
+        }
+
+        let (mut num, mut den) = (0.0, 0.0);
+        for t in desde..=corte {
+            num += fila[t] * g[t];
+            den += g[t] * g[t];
+        }
+        let lambda = num / den;
+        for t in corte..n {
+            fila[t] = lambda * g[t];
+        }
+    }
+
+    let norma = ((2.0 * j1 + 1.0) * fila.iter().map(|f| f * f).sum::<f64>()).sqrt();
+    let escala = if (fila[n - 1] > 0.0) == (signo > 0.0) { 1.0 / norma } else { -1.0 / norma };
+    fila.iter_mut().for_each(|f| *f *= escala);
+}
+
+// Caché de símbolos 3j para todo el proceso. Los coeficientes dependen solo de
+// (l1, l2, l3, m1, m2), así que cada triángulo se calcula una vez y se reutiliza entre
+// llamadas y réplicas. Opcionalmente se vuelca a un archivo que otros procesos mapean
+// en memoria (las páginas se comparten vía el caché del sistema operativo).
+
+/// Tabla densa de un triángulo: fila m1 ∈ [-l1, l1], columna m2 ∈ [-l2, l2] (row-major),
+/// con m3 = -m1 - m2 implícito y cero donde |m3| > l3.
+struct TablaWigner {
+    l1: u16,
+    l2: u16,
+    valores: AlmacenTabla,
+    /// Copia f32 para el modo rápido, creada en el primer uso.
+    valores_f32: OnceLock<Vec<f32>>,
+}
+
+enum AlmacenTabla {
+    Propio(Vec<f64>),
+    Mapeado { mapa: Arc<Mmap>, inicio: usize, largo: usize },
+}
+
+impl TablaWigner {
+    /// Cada fila m1 sale de una barrida de recurrencia en m2 (`fila_wigner_3j`), en vez de
+    /// (2l1 + 1)(2l2 + 1) evaluaciones independientes por factoriales.
+    fn calcular(l1: u16, l2: u16, l3: u16) -> TablaWigner {
+        let mut valores = vec![0.0f64; (2 * l1 as usize + 1) * (2 * l2 as usize + 1)];
+        let (a, b, c) = (l1 as u32, l2 as u32, l3 as u32);
+        if c <= a + b && a <= b + c && b <= a + c {
+            let mut auxiliar = Vec::new();
+            recorrer_filas_triangulo(l1, l2, l3, |i1, w0, _, _, largo| {
+                let m1 = i1 as isize - l1 as isize;
+                fila_wigner_3j(l1, l2, l3, m1, &mut valores[w0..w0 + largo], &mut auxiliar);
+            });
+        }
+        TablaWigner { l1, l2, valores: AlmacenTabla::Propio(valores), valores_f32: OnceLock::new() }
+    }
+
+    fn valores(&self) -> &[f64] {
+        match &self.valores {
+            AlmacenTabla::Propio(valores) => valores,
+            AlmacenTabla::Mapeado { mapa, inicio, largo } => {
+                let bytes = &mapa[*inicio..*inicio + *largo * 8];
+                // SEGURIDAD: `cargar_cache_wigner` verifica alineación a 8 bytes, límites del
+                // archivo y que el host sea little-endian antes de crear esta variante.
+                unsafe { std::slice::from_raw_parts(bytes.as_ptr() as *const f64, *largo) }
+            }
+        }
+    }
+
+    fn valores_f32(&self) -> &[f32] {
+        self.valores_f32.get_or_init(|| self.valores().iter().map(|&w| w as f32).collect())
+    }
+}
+
+type ClaveTriangulo = (u16, u16, u16);
+
+fn cache_wigner() -> &'static RwLock<HashMap<ClaveTriangulo, Arc<TablaWigner>>> {
+    static CACHE: OnceLock<RwLock<HashMap<ClaveTriangulo, Arc<TablaWigner>>>> = OnceLock::new();
+    CACHE.get_or_init(|| RwLock::new(HashMap::new()))
+}
+
+/// Tabla 3j del triángulo, calculándola y guardándola en el caché si aún no existe.
+fn tabla_wigner(l1: u16, l2: u16, l3: u16) -> Arc<TablaWigner> {
+    let clave = (l1, l2, l3);
+    if let Some(tabla) = cache_wigner().read().unwrap_or_else(|e| e.into_inner()).get(&clave) {
+        return Arc::clone(tabla);
+    }
+    // Se calcula fuera del candado; si otro hilo ganó la carrera se conserva su tabla.
+    let tabla = Arc::new(TablaWigner::calcular(l1, l2, l3));
+    let mut cache = cache_wigner().write().unwrap_or_else(|e| e.into_inner());
+    Arc::clone(cache.entry(clave).or_insert(tabla))
+}
+
+/// Como `tabla_wigner`, pero una tabla ausente se calcula sin guardarla: para barridos
+/// de todos los triángulos, cuyo volumen (~400 MB en l_max = 64) no debe quedar residente.
+fn tabla_wigner_sin_guardar(l1: u16, l2: u16, l3: u16) -> Arc<TablaWigner> {
+    let cache = cache_wigner().read().unwrap_or_else(|e| e.into_inner());
+    match cache.get(&(l1, l2, l3)) {
+        Some(tabla) => Arc::clone(tabla),
+        None => Arc::new(TablaWigner::calcular(l1, l2, l3)),
+    }
+}
+
+// Formato del archivo (little-endian):
+//   b"WIG3JV01" | n_tablas: u64 | n × (l1, l2, l3, 0: u32; inicio, largo: u64) | datos f64
+// Cada tabla empieza en un desplazamiento múltiplo de 8 bytes.
+const MAGIA_CACHE_WIGNER: &[u8; 8] = b"WIG3JV01";
+const BYTES_ENTRADA_INDICE: usize = 32;
+
+/// Vuelca el caché 3j a `ruta` (escritura atómica vía archivo temporal + rename).
+/// Devuelve el número de tablas escritas.
+#[pyfunction]
+fn guardar_cache_wigner(ruta: String) -> PyResult<usize> {
+    let cache = cache_wigner().read().unwrap_or_else(|e| e.into_inner());
+    let mut claves: Vec<&ClaveTriangulo> = cache.keys().collect();
+    claves.sort();
+
+    let mut inicio = 16 + claves.len() * BYTES_ENTRADA_INDICE;
+    let mut indice = Vec::with_capacity(claves.len() * BYTES_ENTRADA_INDICE);
+    for clave in &claves {
+        let largo = cache[*clave].valores().len();
+        for l in [clave.0, clave.1, clave.2, 0] {
+            indice.extend_from_slice(&(l as u32).to_le_bytes());
+        }
+        indice.extend_from_slice(&(inicio as u64).to_le_bytes());
+        indice.extend_from_slice(&(largo as u64).to_le_bytes());
+        inicio += largo * 8;
+    }
+
+    // Temporal único por proceso e hilo: dos llamadas concurrentes no comparten archivo
+    let temporal = format!("{}.tmp{}-{:?}", ruta, std::process::id(), std::thread::current().id());
+    {
+        let mut writer = std::io::BufWriter::new(File::create(&temporal)?);
+        writer.write_all(MAGIA_CACHE_WIGNER)?;
+        writer.write_all(&(claves.len() as u64).to_le_bytes())?;
+        writer.write_all(&indice)?;
+        for clave in &claves {
+            for valor in cache[*clave].valores() {
+                writer.write_all(&valor.to_le_bytes())?;
+            }
+        }
+        writer.flush()?;
+    }
+    std::fs::rename(&temporal, &ruta)?;
+
+    Ok(claves.len())
+}
+
+/// Mapea en memoria un archivo escrito por `guardar_cache_wigner` y registra sus tablas
+/// en el caché (sin copiarlas). Las tablas ya presentes se conservan.
+/// Devuelve el número de tablas nuevas.
+#[pyfunction]
+fn cargar_cache_wigner(ruta: String) -> PyResult<usize> {
+    if cfg!(target_endian = "big") {
+        return Err(PyValueError::new_err("el caché 3j mapeado requiere un host little-endian"));
+    }
+
+    let archivo = File::open(&ruta)?;
+    // SEGURIDAD: el archivo solo se escribe vía temporal + rename, nunca en sitio.
+    let mapa = Arc::new(unsafe { Mmap::map(&archivo)? });
+    let invalido = |motivo: &str| PyValueError::new_err(format!("{}: {}", ruta, motivo));
+
+    if mapa.len() < 16 || &mapa[..8] != MAGIA_CACHE_WIGNER {
+        return Err(invalido("no es un caché 3j válido"));
+    }
+    if mapa.as_ptr() as usize % 8 != 0 {
+        return Err(invalido("mapeo no alineado a 8 bytes"));
+    }
+    let leer_u64 = |pos: usize| u64::from_le_bytes(mapa[pos..pos + 8].try_into().unwrap()) as usize;
+    let leer_u32 = |pos: usize| u32::from_le_bytes(mapa[pos..pos + 4].try_into().unwrap());
+
+    let n_tablas = leer_u64(8);
+    if 16 + n_tablas.saturating_mul(BYTES_ENTRADA_INDICE) > mapa.len() {
+        return Err(invalido("índice truncado"));
+    }
+
+    // Todo el índice se valida antes de tocar el caché: un archivo inválido no deja
+    // ninguna de sus tablas registrada.
+    let mut entradas: Vec<(ClaveTriangulo, usize, usize)> = Vec::with_capacity(n_tablas);
+    for i in 0..n_tablas {
+        let pos = 16 + i * BYTES_ENTRADA_INDICE;
+        let l = |k: usize| u16::try_from(leer_u32(pos + 4 * k)).map_err(|_| invalido("multipolo fuera de rango"));
+        let (l1, l2, l3) = (l(0)?, l(1)?, l(2)?);
+        let (inicio, largo) = (leer_u64(pos + 16), leer_u64(pos + 24));
+
+        let esperado = (2 * l1 as usize + 1) * (2 * l2 as usize + 1);
+        let fin = largo.checked_mul(8).and_then(|b| b.checked_add(inicio));
+        if largo != esperado || inicio % 8 != 0 || fin.map_or(true, |f| f > mapa.len()) {
+            return Err(invalido("tabla corrupta"));
+        }
+        entradas.push(((l1, l2, l3), inicio, largo));
+    }
+
+    let mut cache = cache_wigner().write().unwrap_or_else(|e| e.into_inner());
+    let mut nuevas = 0;
+    for ((l1, l2, l3), inicio, largo) in entradas {
+        if let std::collections::hash_map::Entry::Vacant(hueco) = cache.entry((l1, l2, l3)) {
+            hueco.insert(Arc::new(TablaWigner {
+                l1,
+                l2,
+                valores: AlmacenTabla::Mapeado { mapa: Arc::clone(&mapa), inicio, largo },
+                valores_f32: OnceLock::new(),
+            }));
+            nuevas += 1;
+        }
+    }
+
+    Ok(nuevas)
+}
+
+/// Vacía el caché 3j del proceso. Devuelve el número de tablas descartadas.
+#[pyfunction]
+fn limpiar_cache_wigner() -> usize {
+    let mut cache = cache_wigner().write().unwrap_or_else(|e| e.into_inner());
+    let n = cache.len();
+    cache.clear();
+    n
+}
+
+/// (número de tablas, bytes de coeficientes) del caché 3j.
+#[pyfunction]
+fn info_cache_wigner() -> (usize, usize) {
+    let cache = cache_wigner().read().unwrap_or_else(|e| e.into_inner());
+    let bytes = cache.values().map(|tabla| tabla.valores().len() * 8).sum();
+    (cache.len(), bytes)
+}
+
+
+/// Modo de precisión del núcleo del bispectro. Las cotas son relativas a
+/// P·Σ|w·a1·a2·a3|, con P el prefactor y n ≤ (2l1 + 1)(2l2 + 1) el número de términos:
+///
+/// * `Rapida`: tabla 3j en f32 y acumulación f32 en `CARRILES` sumas parciales sin
+///   comprobación de límites por término (el compilador las vectoriza).
+///   Error ≤ ((2l2 + 1) / CARRILES + 2l1 + 8)·2⁻²⁴.
+/// * `Exacta`: tabla 3j y productos en f64 con suma compensada de Neumaier; el resultado
+///   no se redondea a f32. Error ≤ 2⁻⁵²·|B| / (P·Σ|w·a1·a2·a3|) + 4·2⁻⁵³ para n ≤ 2²⁶
+///   (más el error propio de los 3j, ~1e-15 relativo).
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+enum Precision {
+    Rapida,
+    Exacta,
+}
+
+impl Precision {
+    fn desde_nombre(nombre: &str) -> PyResult<Precision> {
+        match nombre {
+            "rapida" => Ok(Precision::Rapida),
+            "exacta" => Ok(Precision::Exacta),
+            otro => Err(PyValueError::new_err(format!(
+                "precision desconocida '{}': use 'rapida' o 'exacta'", otro
+            ))),
+        }
+    }
+}
+
+const CARRILES: usize = 8;
+
+/// Σ w[i]·a[i]·b[i] en f32 con `CARRILES` acumuladores independientes (vectorizable).
+fn suma_triple_f32(w: &[f32], a: &[f32], b: &[f32]) -> f32 {
+    let n = w.len();
+    let (a, b) = (&a[..n], &b[..n]);
+    let cuerpo = n - n % CARRILES;
+
+    let mut carriles = [0.0f32; CARRILES];
+    for ((cw, ca), cb) in w[..cuerpo].chunks_exact(CARRILES)
+        .zip(a[..cuerpo].chunks_exact(CARRILES))
+        .zip(b[..cuerpo].chunks_exact(CARRILES))
+    {
+        let cw: &[f32; CARRILES] = cw.try_into().unwrap();
+        let ca: &[f32; CARRILES] = ca.try_into().unwrap();
+        let cb: &[f32; CARRILES] = cb.try_into().unwrap();
+        for k in 0..CARRILES {
+            carriles[k] += cw[k] * ca[k] * cb[k];
+        }
+    }
+
+    let mut resto = 0.0f32;
+    for ((&x, &y), &z) in w[cuerpo..].iter().zip(&a[cuerpo..]).zip(&b[cuerpo..]) {
+        resto += x * y * z;
+    }
+
+    // Reducción en árbol de los carriles
+    let mut ancho = CARRILES;
+    while ancho > 1 {
+        ancho /= 2;
+        for k in 0..ancho {
+            carriles[k] += carriles[k + ancho];
+        }
+    }
+    carriles[0] + resto
+}
+
+/// Suma compensada de Neumaier.
+#[derive(Default)]
+struct SumaCompensada {
+    suma: f64,
+    compensacion: f64,
+}
+
+impl SumaCompensada {
+    #[inline]
+    fn sumar(&mut self, x: f64) {
+        let t = self.suma + x;
+        if self.suma.abs() >= x.abs() {
+            self.compensacion += (self.suma - t) + x;
+        } else {
+            self.compensacion += (x - t) + self.suma;
+        }
+        self.suma = t;
+    }
+
+    fn total(&self) -> f64 {
+        self.suma + self.compensacion
+    }
+}
+
+/// Recorre las filas m1 de la tabla de un triángulo con el rango válido de m2
+/// (|m3| = |m1 + m2| <= l3). Para cada fila llama a
+/// `f(m1 + l1, inicio_en_tabla, m2_min + l2, l3 + m1 + m2_min, largo)`, donde el cuarto
+/// índice recorre los coeficientes de l3 en orden invertido (m3 decrece al crecer m2).
+fn recorrer_filas_triangulo(l1: u16, l2: u16, l3: u16, mut f: impl FnMut(usize, usize, usize, usize, usize)) {
+    let (l1, l2, l3) = (l1 as isize, l2 as isize, l3 as isize);
+    let columnas = (2 * l2 + 1) as usize;
+    for m1 in -l1..=l1 {
+        let m2_min = (-l2).max(-l3 - m1);
+        let m2_max = l2.min(l3 - m1);
+        if m2_min > m2_max {
+            continue;
+        }
+        let fila = (m1 + l1) as usize;
+        let j0 = (m2_min + l2) as usize;
+        f(fila, fila * columnas + j0, j0, (l3 + m1 + m2_min) as usize, (m2_max - m2_min + 1) as usize);
+    }
+}
+
+/// Coeficientes a_lm (m = -l..=l) de la muestra: índice l² + m + l.
+#[inline]
+fn modos_de_l(modos_b: &[f32], l: u16) -> &[f32] {
+    let inicio = (l as usize) * (l as usize);
+    &modos_b[inicio..inicio + 2 * l as usize + 1]
+}
+
+fn calcular_bispectro_config(
+    modos_b: &[f32],
+    l1: u16,
+    l2: u16,
+    l3: u16,
+    precision: Precision
+) -> f64 {
+    if !condiciones_triangulo(l1, l2, l3) {
+        return 0.0;
+    }
+
+    let tabla = tabla_wigner(l1, l2, l3);
+    let (a1, a2) = (modos_de_l(modos_b, l1), modos_de_l(modos_b, l2));
+
+    let suma = match precision {
+        Precision::Rapida => {
+            let pesos = tabla.valores_f32();
+            let a3_inv: Vec<f32> = modos_de_l(modos_b, l3).iter().rev().copied().collect();
+            let mut suma = 0.0f32;
+            recorrer_filas_triangulo(l1, l2, l3, |i1, w0, j0, k0, largo| {
+                suma += a1[i1] * suma_triple_f32(
+                    &pesos[w0..w0 + largo], &a2[j0..j0 + largo], &a3_inv[k0..k0 + largo]
+                );
+            });
+            suma as f64
+        }
+        Precision::Exacta => {
+            let pesos = tabla.valores();
+            let a3_inv: Vec<f64> = modos_de_l(modos_b, l3).iter().rev().map(|&a| a as f64).collect();
+            let mut suma = SumaCompensada::default();
+            recorrer_filas_triangulo(l1, l2, l3, |i1, w0, j0, k0, largo| {
+                let a1 = a1[i1] as f64;
+                for ((&w, &b2), &b3) in pesos[w0..w0 + largo].iter()
+                    .zip(&a2[j0..j0 + largo])
+                    .zip(&a3_inv[k0..k0 + largo])
+                {
+                    suma.sumar(w * a1 * b2 as f64 * b3);
+                }
+            });
+            suma.total()
+        }
+    };
+
+    prefactor_bispectro(l1, l2, l3) * suma
 }
 
-#[pyfunction]
-fn modelo_vorticidad_plasma(
-    parametros: Vec<f32>,
-    n_puntos: u16
-) -> PyResult<Vec<f32>> {
-    let resultado: Vec<f32> = (0..n_puntos).map(|i| {
-        let x = i as f32 / n_puntos as f32 * 2.0 * PI as f32;
-        parametros[0] * x.sin() * (-parametros[1] * x).exp()
-    }).collect();
-    Ok(resultado)
+/// √((2l1 + 1)(2l2 + 1)(2l3 + 1) / 4π)
+fn prefactor_bispectro(l1: u16, l2: u16, l3: u16) -> f64 {
+    let producto = ((2 * l1 as u64 + 1) * (2 * l2 as u64 + 1) * (2 * l3 as u64 + 1)) as f64;
+    (producto / (4.0 * PI)).sqrt()
+}
+
+/// Bispectros de todos los `l3s` de un par (l1, l2). El producto a_{l1 m1}·a_{l2 m2} no
+/// depende de l3, así que se forma una vez con la misma disposición que la tabla 3j
+/// (fila m1, columna m2) y cada l3 se reduce a Σ w·P·a3 por filas.
+fn calcular_bispectros_par(
+    modos_b: &[f32],
+    l1: u16,
+    l2: u16,
+    l3s: &[u16],
+    precision: Precision
+) -> Vec<f64> {
+    let (a1, a2) = (modos_de_l(modos_b, l1), modos_de_l(modos_b, l2));
+
+    match precision {
+        Precision::Rapida => {
+            let producto: Vec<f32> = a1.iter()
+                .flat_map(|&x| a2.iter().map(move |&y| x * y))
+                .collect();
+            l3s.iter().map(|&l3| {
+                let tabla = tabla_wigner_sin_guardar(l1, l2, l3);
+                let pesos = tabla.valores_f32();
+                let a3_inv: Vec<f32> = modos_de_l(modos_b, l3).iter().rev().copied().collect();
+                let mut suma = 0.0f32;
+                recorrer_filas_triangulo(l1, l2, l3, |_, w0, _, k0, largo| {
+                    suma += suma_triple_f32(
+                        &pesos[w0..w0 + largo], &producto[w0..w0 + largo], &a3_inv[k0..k0 + largo]
+                    );
+                });
+                prefactor_bispectro(l1, l2, l3) * suma as f64
+            }).collect()
+        }
+        Precision::Exacta => {
+            let producto: Vec<f64> = a1.iter()
+                .flat_map(|&x| a2.iter().map(move |&y| x as f64 * y as f64))
+                .collect();
+            l3s.iter().map(|&l3| {
+                let tabla = tabla_wigner_sin_guardar(l1, l2, l3);
+                let pesos = tabla.valores();
+                let a3_inv: Vec<f64> = modos_de_l(modos_b, l3).iter().rev().map(|&a| a as f64).collect();
+                let mut suma = SumaCompensada::default();
+                recorrer_filas_triangulo(l1, l2, l3, |_, w0, _, k0, largo| {
+                    for ((&w, &p), &b3) in pesos[w0..w0 + largo].iter()
+                        .zip(&producto[w0..w0 + largo])
+                        .zip(&a3_inv[k0..k0 + largo])
+                    {
+                        suma.sumar(w * p * b3);
+                    }
+                });
+                prefactor_bispectro(l1, l2, l3) * suma.total()
+            }).collect()
+        }
+    }
+}
+
+/// Todos los triángulos válidos l_min <= l1 <= l2 <= l3 <= l_max (l3 <= l1 + l2,
+/// l1 + l2 + l3 par), agrupados por (l1, l2) en orden lexicográfico.
+fn triangulos_validos(l_min: u16, l_max: u16) -> Vec<(u16, u16, Vec<u16>)> {
+    let mut grupos = Vec::new();
+    for l1 in l_min..=l_max {
+        for l2 in l1..=l_max {
+            let l3_max = (l1 as u32 + l2 as u32).min(l_max as u32) as u16;
+            let l3s: Vec<u16> = (l2..=l3_max).filter(|&l3| condiciones_triangulo(l1, l2, l3)).collect();
+            if !l3s.is_empty() {
+                grupos.push((l1, l2, l3s));
+            }
+        }
+    }
+    grupos
 }
 
+/// Bispectro de todos los triángulos válidos hasta `l_max` en una pasada.
+/// Devuelve `(configs, valores)`: un arreglo (n, 3) int64 con (l1, l2, l3) en orden
+/// lexicográfico y el float64 correspondiente. Los pares (l1, l2) se reparten entre hilos
+/// y cada uno comparte su producto a_{l1}·a_{l2} entre todos sus l3.
 #[pyfunction]
-fn estadisticas_no_gaussianas(datos: Vec<f32>) -> PyResult<Vec<f32>> {
-    let n = datos.len() as f32;
-    let media = datos.iter().sum::<f32>() / n;
-    let varianza = datos.iter().map(|&x| (x - media).powi(2)).sum::<f32>() / n;
-    let desviacion = varianza.sqrt();
-
-    let asimetria = if desviacion > 0.0 {
-        datos.iter().map(|&x| ((x - media) / desviacion).powi(3)).sum::<f32>() / n
-    } else {
-        0.0
-    };
+#[pyo3(signature = (modos_b, l_max, l_min = 1, precision = "rapida"))]
+fn calcular_bispectro_todos<'py>(
+    py: Python<'py>,
+    modos_b: MuestraEntrada<'py>,
+    l_max: u16,
+    l_min: u16,
+    precision: &str
+) -> PyResult<(&'py PyArray2<i64>, &'py PyArray1<f64>)> {
+    let precision = Precision::desde_nombre(precision)?;
+    let grupos = triangulos_validos(l_min, l_max);
+    let modos = modos_b.prefijo((l_max as usize + 1) * (l_max as usize + 1));
+
+    let valores: Vec<f64> = py.allow_threads(|| en_pool(|| {
+        grupos.par_iter()
+            .map(|(l1, l2, l3s)| calcular_bispectros_par(&modos, *l1, *l2, l3s, precision))
+            .collect::<Vec<Vec<f64>>>()
+            .concat()
+    }));
+
+    let configs: Vec<i64> = grupos.iter()
+        .flat_map(|(l1, l2, l3s)| l3s.iter().flat_map(move |&l3| [*l1 as i64, *l2 as i64, l3 as i64]))
+        .collect();
+    let configs = Array2::from_shape_vec((valores.len(), 3), configs)
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
 
-    let curtosis = if desviacion > 0.0 {
-        datos.iter().map(|&x| ((x - media) / desviacion).powi(4)).sum::<f32>() / n - 3.0
-    } else {
-        0.0
-    };
+    Ok((configs.into_pyarray(py), valores.into_pyarray(py)))
+}
 
-    Ok(vec![media, varianza, asimetria, curtosis])
+// Motor de réplicas para los cocientes de evolución en redshift. Cada réplica toma una
+// muestra sin reemplazo de cada bin, calcula los bispectros y devuelve
+// |B_alto(ref)| / |B_bajo(ref)| y <|B_alto(esc)|> / <|B_bajo(esc)|>. Los números aleatorios
+// salen de Philox-4x32-10 indexado por (semilla, réplica, bin, contador), así que el
+// resultado es el mismo con cualquier número de hilos.
+
+const PHILOX_M0: u32 = 0xD251_1F53;
+const PHILOX_M1: u32 = 0xCD9E_8D57;
+const PHILOX_W0: u32 = 0x9E37_79B9;
+const PHILOX_W1: u32 = 0xBB67_AE85;
+
+/// Philox-4x32 con 10 rondas (Salmon et al. 2011, Random123).
+fn philox4x32(contador: [u32; 4], clave: [u32; 2]) -> [u32; 4] {
+    let (mut c, mut k) = (contador, clave);
+    for _ in 0..10 {
+        let p0 = PHILOX_M0 as u64 * c[0] as u64;
+        let p1 = PHILOX_M1 as u64 * c[2] as u64;
+        c = [
+            (p1 >> 32) as u32 ^ c[1] ^ k[0],
+            p1 as u32,
+            (p0 >> 32) as u32 ^ c[3] ^ k[1],
+            p0 as u32,
+        ];
+        k = [k[0].wrapping_add(PHILOX_W0), k[1].wrapping_add(PHILOX_W1)];
+    }
+    c
 }
 
-fn condiciones_triangulo(l1: u16, l2: u16, l3: u16) -> bool {
-    (l1 + l2 >= l3) && (l1 + l3 >= l2) && (l2 + l3 >= l1) &&
-    (l1 + l2 + l3) % 2 == 0 
+/// Flujo de enteros aleatorios: bloque `contador` del flujo `flujo` bajo la clave `semilla`.
+struct FlujoPhilox {
+    clave: [u32; 2],
+    flujo: u64,
+    contador: u64,
+    reserva: [u32; 4],
+    usados: usize,
 }
 
-// 🚨 CORRECCIÓN CRÍTICA: Uso del crate 'wigners' y corrección de tipos
-fn calcular_wigner_3j(l1: u16, l2: u16, l3: u16, m1: i16, m2: i16, m3: i16) -> f32 {
-    
-    // Filtros rápidos (Reglas de selección)
-    if !condiciones_triangulo(l1, l2, l3) {
-        return 0.0;
+impl FlujoPhilox {
+    fn nuevo(semilla: u64, flujo: u64) -> FlujoPhilox {
+        FlujoPhilox {
+            clave: [semilla as u32, (semilla >> 32) as u32],
+            flujo,
+            contador: 0,
+            reserva: [0; 4],
+            usados: 4,
+        }
     }
-    if m1 + m2 + m3 != 0 {
-        return 0.0;
+
+    fn siguiente_u64(&mut self) -> u64 {
+        if self.usados == 4 {
+            let bloque = [
+                self.contador as u32, (self.contador >> 32) as u32,
+                self.flujo as u32, (self.flujo >> 32) as u32,
+            ];
+            self.reserva = philox4x32(bloque, self.clave);
+            self.contador += 1;
+            self.usados = 0;
+        }
+        let valor = (self.reserva[self.usados] as u64) << 32 | self.reserva[self.usados + 1] as u64;
+        self.usados += 2;
+        valor
     }
-    if m1.abs() > l1 as i16 || m2.abs() > l2 as i16 || m3.abs() > l3 as i16 {
-        return 0.0;
+
+    /// Entero uniforme en [0, n) sin sesgo (método de Lemire con rechazo).
+    fn uniforme_bajo(&mut self, n: u64) -> u64 {
+        let mut producto = self.siguiente_u64() as u128 * n as u128;
+        if (producto as u64) < n {
+            let umbral = n.wrapping_neg() % n;
+            while (producto as u64) < umbral {
+                producto = self.siguiente_u64() as u128 * n as u128;
+            }
+        }
+        (producto >> 64) as u64
     }
+}
 
-    // ✅ CORRECCIÓN DE TIPO: Usar u32 para l1, l2, l3. (Números cuánticos angulares no negativos)
-    wigner_3j(
-        l1 as u32, l2 as u32, l3 as u32, 
-        m1 as i32, m2 as i32, m3 as i32
-    ) as f32
+/// Primeros `k` elementos de una permutación aleatoria de 0..n (Fisher–Yates parcial con
+/// los intercambios en un mapa disperso): O(k) en tiempo y memoria.
+fn muestra_sin_reemplazo(flujo: &mut FlujoPhilox, n: usize, k: usize) -> Vec<usize> {
+    let mut intercambios: HashMap<usize, usize> = HashMap::with_capacity(2 * k);
+    (0..k.min(n)).map(|i| {
+        let j = i + flujo.uniforme_bajo((n - i) as u64) as usize;
+        let en_j = *intercambios.get(&j).unwrap_or(&j);
+        let en_i = *intercambios.get(&i).unwrap_or(&i);
+        intercambios.insert(j, en_i);
+        en_j
+    }).collect()
 }
 
-// 🔧 CORRECCIÓN: Función 'obtener_modo' - Índice Óptimo (l² + m + l)
-fn obtener_modo(modos_b: &[f32], l: u16, m: i16, _l_max: u16) -> f32 {
-    let idx: usize = (l as usize).pow(2) + (m + l as i16) as usize;
-    
-    if idx < modos_b.len() { 
-        modos_b[idx] 
-    } else { 
-        0.0 
+/// Cocientes de evolución por réplica entre dos bins de redshift.
+///
+/// `bin_bajo` y `bin_alto` son las columnas VDISP de cada bin (cualquier arreglo 1-D; una
+/// rebanada `vdisp[inicio:fin]` de un catálogo ordenado sirve sin copia). Para cada una
+/// de las `n_replicas` réplicas se toman `tamano_muestra` galaxias sin reemplazo de cada
+/// bin y se calculan los bispectros de `configs`: la primera configuración es la de
+/// referencia (p. ej. (2, 2, 2)) y el resto se promedia en |B| (escalenos).
+/// Devuelve `(evol_ref, evol_esc)`, con NaN donde el denominador es cero.
+///
+/// Del orden aleatorio de cada muestra solo se sortean las (l_max_config + 1)² primeras
+/// posiciones, que son las únicas que lee el núcleo; la distribución es la misma que la de
+/// `np.random.choice(bin, tamano_muestra, replace=False)`.
+#[pyfunction]
+#[pyo3(signature = (bin_bajo, bin_alto, tamano_muestra, n_replicas, configs, semilla, precision = "rapida"))]
+fn evolucion_replicas<'py>(
+    py: Python<'py>,
+    bin_bajo: MuestraEntrada<'py>,
+    bin_alto: MuestraEntrada<'py>,
+    tamano_muestra: usize,
+    n_replicas: usize,
+    configs: ConfigsEntrada<'py>,
+    semilla: u64,
+    precision: &str
+) -> PyResult<(&'py PyArray1<f64>, &'py PyArray1<f64>)> {
+    let precision = Precision::desde_nombre(precision)?;
+    let configs = configs.a_triangulos()?;
+    if configs.is_empty() {
+        return Err(PyValueError::new_err("configs no puede estar vacío"));
+    }
+    let (bajo, alto) = (bin_bajo.vista(), bin_alto.vista());
+    for (nombre, vista) in [("bin_bajo", &bajo), ("bin_alto", &alto)] {
+        if vista.len() < tamano_muestra {
+            return Err(PyValueError::new_err(format!(
+                "{} tiene {} galaxias, menos que tamano_muestra={}", nombre, vista.len(), tamano_muestra
+            )));
+        }
     }
+    let n = modos_necesarios(&configs);
+
+    let evoluciones: Vec<(f64, f64)> = py.allow_threads(|| en_pool(|| {
+        (0..n_replicas).into_par_iter().map(|r| {
+            let bispectros = |vista: &VistaCatalogo, id_bin: u64| {
+                let mut flujo = FlujoPhilox::nuevo(semilla, 2 * r as u64 + id_bin);
+                let mut modos = vec![0.0f32; n];
+                for (destino, i) in modos.iter_mut()
+                    .zip(muestra_sin_reemplazo(&mut flujo, vista.len(), n.min(tamano_muestra)))
+                {
+                    *destino = vista.valor(i);
+                }
+                let mut valores = vec![0.0f64; configs.len()];
+                rellenar_bispectros(&modos, &configs, precision, &mut valores);
+                valores.iter_mut().for_each(|b| *b = b.abs());
+                valores
+            };
+            let (b_bajo, b_alto) = (bispectros(&bajo, 0), bispectros(&alto, 1));
+
+            let cociente = |num: f64, den: f64| if den > 0.0 { num / den } else { f64::NAN };
+            let media = |b: &[f64]| b.iter().sum::<f64>() / b.len() as f64;
+            let evol_ref = cociente(b_alto[0], b_bajo[0]);
+            let evol_esc = if configs.len() > 1 {
+                cociente(media(&b_alto[1..]), media(&b_bajo[1..]))
+            } else {
+                f64::NAN
+            };
+            (evol_ref, evol_esc)
+        }).collect()
+    }));
+
+    let (evol_ref, evol_esc): (Vec<f64>, Vec<f64>) = evoluciones.into_iter().unzip();
+    Ok((evol_ref.into_pyarray(py), evol_esc.into_pyarray(py)))
 }
 
+// Implementación de generación de imágenes y reportes
 
-fn calcular_bispectro_config(
-    modos_b: &[f32],
-    l1: u16,
-    l2: u16,
-    l3: u16,
-    l_max: u16
-) -> f32 {
-    if !condiciones_triangulo(l1, l2, l3) {
-        return 0.0;
+// Codificador PNG en flujo: escala de grises de 8 bits, fila a fila, con filtro por fila y
+// deflate de nivel configurable. Solo se guardan la fila anterior, la actual y las
+// candidatas filtradas, así que la memoria depende del ancho y no del tamaño de la imagen.
+
+/// Bytes de datos comprimidos por chunk IDAT.
+const TAMANO_IDAT: usize = 1 << 16;
+
+/// Filtro de fila PNG (tipo 0-4) o elección adaptativa por fila.
+#[derive(Clone, Copy, Debug, PartialEq)]
+enum FiltroPng {
+    Ninguno,
+    Sub,
+    Up,
+    Average,
+    Paeth,
+    Adaptativo,
+}
+
+impl FiltroPng {
+    const FIJOS: [FiltroPng; 5] = [
+        FiltroPng::Ninguno, FiltroPng::Sub, FiltroPng::Up, FiltroPng::Average, FiltroPng::Paeth,
+    ];
+
+    fn desde_nombre(nombre: &str) -> PyResult<FiltroPng> {
+        match nombre {
+            "ninguno" => Ok(FiltroPng::Ninguno),
+            "sub" => Ok(FiltroPng::Sub),
+            "up" => Ok(FiltroPng::Up),
+            "average" => Ok(FiltroPng::Average),
+            "paeth" => Ok(FiltroPng::Paeth),
+            "adaptativo" => Ok(FiltroPng::Adaptativo),
+            otro => Err(PyValueError::new_err(format!(
+                "filtro desconocido '{}': use 'ninguno', 'sub', 'up', 'average', 'paeth' o 'adaptativo'", otro
+            ))),
+        }
+    }
+
+    /// Escribe en `salida` el byte de tipo seguido de `fila` filtrada (1 byte por píxel).
+    fn aplicar(self, fila: &[u8], anterior: &[u8], salida: &mut [u8]) {
+        let paeth = |a: u8, b: u8, c: u8| {
+            let p = a as i16 + b as i16 - c as i16;
+            let (pa, pb, pc) = ((p - a as i16).abs(), (p - b as i16).abs(), (p - c as i16).abs());
+            if pa <= pb && pa <= pc { a } else if pb <= pc { b } else { c }
+        };
+        let (tipo, datos) = salida.split_first_mut().expect("salida incluye el byte de tipo");
+        for i in 0..fila.len() {
+            let a = if i > 0 { fila[i - 1] } else { 0 };
+            let (b, c) = (anterior[i], if i > 0 { anterior[i - 1] } else { 0 });
+            let prediccion = match self {
+                FiltroPng::Ninguno | FiltroPng::Adaptativo => 0,
+                FiltroPng::Sub => a,
+                FiltroPng::Up => b,
+                FiltroPng::Average => ((a as u16 + b as u16) / 2) as u8,
+                FiltroPng::Paeth => paeth(a, b, c),
+            };
+            datos[i] = fila[i].wrapping_sub(prediccion);
+        }
+        *tipo = match self {
+            FiltroPng::Ninguno | FiltroPng::Adaptativo => 0,
+            FiltroPng::Sub => 1,
+            FiltroPng::Up => 2,
+            FiltroPng::Average => 3,
+            FiltroPng::Paeth => 4,
+        };
     }
+}
 
-    let mut suma = 0.0f32;
-    let mut contador = 0u16;
+/// Escribe un chunk PNG: longitud, tipo, datos y CRC-32 de tipo + datos.
+fn escribir_chunk_png<W: Write>(destino: &mut W, tipo: &[u8; 4], datos: &[u8]) -> io::Result<()> {
+    let mut crc = crc32fast::Hasher::new();
+    crc.update(tipo);
+    crc.update(datos);
+    destino.write_all(&(datos.len() as u32).to_be_bytes())?;
+    destino.write_all(tipo)?;
+    destino.write_all(datos)?;
+    destino.write_all(&crc.finalize().to_be_bytes())
+}
 
-    for m1 in (-(l1 as i16))..=(l1 as i16) {
-        for m2 in (-(l2 as i16))..=(l2 as i16) {
-            let m3 = -m1 - m2;
-            if m3.abs() > l3 as i16 {
-                continue;
-            }
+/// Reparte el flujo zlib en chunks IDAT de `TAMANO_IDAT` bytes.
+struct FragmentosIdat<W: Write> {
+    destino: W,
+    pendiente: Vec<u8>,
+}
 
-            let wigner = calcular_wigner_3j(l1, l2, l3, m1, m2, m3);
-            let a1 = obtener_modo(modos_b, l1, m1, l_max);
-            let a2 = obtener_modo(modos_b, l2, m2, l_max);
-            let a3 = obtener_modo(modos_b, l3, m3, l_max);
+impl<W: Write> FragmentosIdat<W> {
+    fn vaciar(&mut self) -> io::Result<()> {
+        if !self.pendiente.is_empty() {
+            escribir_chunk_png(&mut self.destino, b"IDAT", &self.pendiente)?;
+            self.pendiente.clear();
+        }
+        Ok(())
+    }
+}
 
-            if wigner != 0.0 { 
-                suma += wigner * a1 * a2 * a3;
-                contador += 1;
-            }
+impl<W: Write> Write for FragmentosIdat<W> {
+    fn write(&mut self, datos: &[u8]) -> io::Result<usize> {
+        let n = datos.len().min(TAMANO_IDAT - self.pendiente.len());
+        self.pendiente.extend_from_slice(&datos[..n]);
+        if self.pendiente.len() == TAMANO_IDAT {
+            self.vaciar()?;
         }
+        Ok(n)
     }
 
-    if contador > 0 {
-        let prefactor = ((2*l1+1) * (2*l2+1) * (2*l3+1)) as f32;
-        let prefactor = (prefactor / (4.0 * PI as f32)).sqrt();
-        prefactor * suma
-    } else {
-        0.0
+    fn flush(&mut self) -> io::Result<()> {
+        Ok(())
+    }
+}
+
+/// Codifica una imagen en escala de grises de 8 bits. `fila(y, destino)` rellena los `ancho`
+/// píxeles de la fila `y`. Devuelve el destino tras escribir IEND.
+fn codificar_png_gris<W: Write>(
+    mut destino: W,
+    ancho: u32,
+    alto: u32,
+    nivel_compresion: u32,
+    filtro: FiltroPng,
+    mut fila: impl FnMut(u32, &mut [u8])
+) -> io::Result<W> {
+    destino.write_all(b"\x89PNG\r\n\x1a\n")?;
+    let mut ihdr = [0u8; 13];
+    ihdr[0..4].copy_from_slice(&ancho.to_be_bytes());
+    ihdr[4..8].copy_from_slice(&alto.to_be_bytes());
+    ihdr[8] = 8; // bits por muestra; tipo de color 0 (gris), compresión, filtro y entrelazado 0
+    escribir_chunk_png(&mut destino, b"IHDR", &ihdr)?;
+
+    let idat = FragmentosIdat { destino, pendiente: Vec::with_capacity(TAMANO_IDAT) };
+    let mut zlib = flate2::write::ZlibEncoder::new(idat, flate2::Compression::new(nivel_compresion.min(9)));
+
+    let ancho = ancho as usize;
+    let (mut actual, mut anterior) = (vec![0u8; ancho], vec![0u8; ancho]);
+    let (mut candidata, mut elegida) = (vec![0u8; ancho + 1], vec![0u8; ancho + 1]);
+    for y in 0..alto {
+        fila(y, &mut actual);
+        if filtro == FiltroPng::Adaptativo {
+            // Heurística habitual: la candidata con menor suma de |byte con signo|
+            let mut mejor = u64::MAX;
+            for f in FiltroPng::FIJOS {
+                f.aplicar(&actual, &anterior, &mut candidata);
+                let coste = candidata[1..].iter().map(|&b| (b as i8).unsigned_abs() as u64).sum::<u64>();
+                if coste < mejor {
+                    mejor = coste;
+                    std::mem::swap(&mut candidata, &mut elegida);
+                }
+            }
+        } else {
+            filtro.aplicar(&actual, &anterior, &mut elegida);
+        }
+        zlib.write_all(&elegida)?;
+        std::mem::swap(&mut actual, &mut anterior);
     }
+
+    let mut idat = zlib.finish()?;
+    idat.vaciar()?;
+    let mut destino = idat.destino;
+    escribir_chunk_png(&mut destino, b"IEND", &[])?;
+    destino.flush()?;
+    Ok(destino)
+}
+
+/// Nivel de gris de 8 bits de una intensidad normalizada a [0, 1].
+#[inline]
+fn a_gris(valor: f32) -> u8 {
+    (valor.clamp(0.0, 1.0) * 255.0) as u8
 }
 
-// Implementación de generación de imágenes y reportes (sin cambios funcionales)
+/// Valida las dimensiones de una imagen PNG.
+fn comprobar_dimensiones_png(ancho: u32, alto: u32) -> PyResult<()> {
+    if ancho == 0 || alto == 0 || ancho > i32::MAX as u32 || alto > i32::MAX as u32 {
+        return Err(PyValueError::new_err(format!("dimensiones PNG no válidas: {}x{}", ancho, alto)));
+    }
+    Ok(())
+}
 
+/// Guarda `datos` (intensidades en [0, 1], fila a fila) como PNG en escala de grises de
+/// 8 bits. Los píxeles que faltan quedan en negro. `nivel_compresion` va de 0 (sin
+/// compresión) a 9; `filtro` es 'ninguno', 'sub', 'up', 'average', 'paeth' o
+/// 'adaptativo' (elige por fila). Acepta arreglos float32/float64 sin copiarlos.
 #[pyfunction]
+#[pyo3(signature = (datos, dimensiones, nombre_archivo, nivel_compresion = 6, filtro = "adaptativo"))]
 fn generar_imagen_png(
-    datos: Vec<f32>,
+    py: Python<'_>,
+    datos: MuestraEntrada<'_>,
     dimensiones: (u32, u32),
-    nombre_archivo: String
+    nombre_archivo: String,
+    nivel_compresion: u32,
+    filtro: &str
 ) -> PyResult<()> {
-    use std::fs::File;
     use std::io::BufWriter;
 
     let (ancho, alto) = dimensiones;
-    let mut buffer = Vec::new();
+    comprobar_dimensiones_png(ancho, alto)?;
+    let filtro = FiltroPng::desde_nombre(filtro)?;
+    let vista = datos.vista();
+    let archivo = BufWriter::new(File::create(&nombre_archivo)?);
+
+    py.allow_threads(|| {
+        let total = vista.len();
+        codificar_png_gris(archivo, ancho, alto, nivel_compresion, filtro, |y, fila| {
+            let inicio = y as usize * ancho as usize;
+            for (x, pixel) in fila.iter_mut().enumerate() {
+                let idx = inicio + x;
+                *pixel = if idx < total { a_gris(vista.valor(idx)) } else { 0 };
+            }
+        })
+    })?;
 
-    // Encabezado PNG básico 
-    buffer.extend_from_slice(b"\x89PNG\r\n\x1a\n");
+    Ok(())
+}
 
-    // Generar imagen en escala de grises (8-bit RGBA)
-    for y in 0..alto {
-        for x in 0..ancho {
-            let idx = (y * ancho + x) as usize;
-            let valor = if idx < datos.len() {
-                (datos[idx].clamp(0.0, 1.0) * 255.0) as u8 
+/// Añade a `destino` la codificación base64 estándar (con relleno) de `datos`.
+fn codificar_base64(datos: &[u8], destino: &mut String) {
+    const ALFABETO: &[u8; 64] = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+    destino.reserve(datos.len().div_ceil(3) * 4);
+    for grupo in datos.chunks(3) {
+        let b = [grupo[0], *grupo.get(1).unwrap_or(&0), *grupo.get(2).unwrap_or(&0)];
+        let n = (b[0] as u32) << 16 | (b[1] as u32) << 8 | b[2] as u32;
+        for k in 0..4 {
+            destino.push(if k <= grupo.len() {
+                ALFABETO[(n >> (18 - 6 * k) & 0x3f) as usize] as char
             } else {
-                0
-            };
-            buffer.push(valor);
-            buffer.push(valor);
-            buffer.push(valor); // RGB
-            buffer.push(255);   // Alpha
+                '='
+            });
         }
     }
-
-    // Guardar archivo
-    let file = File::create(nombre_archivo)?;
-    let mut writer = BufWriter::new(file);
-    std::io::Write::write_all(&mut writer, &buffer)?;
-
-    Ok(())
 }
 
+/// Reporte HTML con el mapa de intensidad incrustado como PNG (data URI, escalado a
+/// 300×300 sin suavizado) y un gráfico de barras de las métricas. El tamaño del archivo
+/// y el tiempo de generación siguen al PNG comprimido, no al número de píxeles.
 #[pyfunction]
 fn generar_reporte_html(
+    py: Python<'_>,
     resultados: Vec<f32>,
-    mapa_intensidad: Vec<f32>,
+    mapa_intensidad: MuestraEntrada<'_>,
     dimensiones: (u32, u32),
     nombre_archivo: String
 ) -> PyResult<()> {
-    use std::fs::File;
-    use std::io::Write;
+    use std::fmt::Write as _;
+
+    let (ancho, alto) = dimensiones;
+    comprobar_dimensiones_png(ancho, alto)?;
+    let vista = mapa_intensidad.vista();
+    let png = py.allow_threads(|| {
+        let total = vista.len();
+        codificar_png_gris(Vec::new(), ancho, alto, 6, FiltroPng::Adaptativo, |y, fila| {
+            let inicio = y as usize * ancho as usize;
+            for (x, pixel) in fila.iter_mut().enumerate() {
+                let idx = inicio + x;
+                *pixel = if idx < total { a_gris(vista.valor(idx)) } else { 0 };
+            }
+        })
+    })?;
 
-    let mut html = String::new();
+    let mut html = String::with_capacity(2048 + png.len().div_ceil(3) * 4 + resultados.len() * 80);
 
     // Cabecera HTML
     html.push_str("<!DOCTYPE html>
 <html>
 <head>
+    <meta charset='utf-8'>
     <title>Análisis Vorticidad Galáctica</title>
     <style>
         .container { display: flex; flex-wrap: wrap; }
         .plot { margin: 10px; border: 1px solid #ccc; }
+        .mapa { image-rendering: pixelated; }
     </style>
 </head>
 <body>
     <h1>🌌 Análisis de Vorticidad en GS-z14</h1>
     <div class='container'>");
 
-    // Generar SVG simple para el mapa de intensidad
+    // Mapa de intensidad como una sola imagen PNG
     html.push_str("<div class='plot'>
     <h3>Mapa de Intensidad</h3>
-    <svg width='300' height='300'>");
-
-    let (ancho, alto) = dimensiones;
-    for y in 0..alto {
-        for x in 0..ancho {
-            let idx = (y * ancho + x) as usize;
-            if idx < mapa_intensidad.len() {
-                let intensidad = (mapa_intensidad[idx].clamp(0.0, 1.0) * 255.0) as u8;
-                html.push_str(&format!(
-                    "<rect x='{}' y='{}' width='1' height='1' fill='rgb({},{},{})'/>",
-                    x * 300 / ancho, y * 300 / alto, intensidad, intensidad, intensidad
-                ));
-            }
-        }
-    }
-
-    html.push_str("</svg></div>");
+    <img class='mapa' width='300' height='300' alt='Mapa de intensidad' src='data:image/png;base64,");
+    codificar_base64(&png, &mut html);
+    html.push_str("'/></div>");
 
     // Gráfica de resultados (Gráfico de barras simple)
     html.push_str("<div class='plot'>
@@ -246,10 +1915,11 @@ fn generar_reporte_html(
         let x = i * 400 / resultados.len();
         let altura = (valor / max_val * 150.0) as u32;
         let color = if valor > 1.5 { "red" } else { "blue" };
-        html.push_str(&format!(
+        let _ = write!(
+            html,
             "<rect x='{}' y='{}' width='10' height='{}' fill='{}'/>",
             x, 200 - altura, altura, color
-        ));
+        );
     }
 
     html.push_str("</svg></div>");
@@ -264,35 +1934,304 @@ fn generar_reporte_html(
     Ok(())
 }
 
+/// Añade un número JSON; NaN e infinitos (que JSON no admite) se escriben como `null`.
+fn escribir_numero_json(destino: &mut String, valor: f32) {
+    use std::fmt::Write as _;
+    if valor.is_finite() {
+        let _ = write!(destino, "{}", valor);
+    } else {
+        destino.push_str("null");
+    }
+}
+
+/// Añade una lista JSON de números.
+fn escribir_lista_json(destino: &mut String, valores: impl Iterator<Item = f32>) {
+    destino.push('[');
+    for (i, valor) in valores.enumerate() {
+        if i > 0 {
+            destino.push_str(", ");
+        }
+        escribir_numero_json(destino, valor);
+    }
+    destino.push(']');
+}
+
+/// Escribe `vista` como arreglo .npy float32 little-endian ('<f4', orden C) con forma `forma`.
+fn escribir_npy_f32(ruta: &std::path::Path, forma: &[usize], vista: &VistaCatalogo) -> io::Result<()> {
+    const VALORES_POR_BLOQUE: usize = 1 << 14;
+
+    let dimensiones: Vec<String> = forma.iter().map(|d| d.to_string()).collect();
+    let forma_texto = if forma.len() == 1 {
+        format!("({},)", dimensiones[0])
+    } else {
+        format!("({})", dimensiones.join(", "))
+    };
+    let mut cabecera = format!("{{'descr': '<f4', 'fortran_order': False, 'shape': {}, }}", forma_texto);
+    // Formato 1.0: magia (6) + versión (2) + longitud (2) + cabecera alineada a 64 y terminada en '\n'
+    let relleno = 63 - (10 + cabecera.len()) % 64;
+    cabecera.extend(std::iter::repeat(' ').take(relleno));
+    cabecera.push('\n');
+
+    let mut writer = io::BufWriter::new(File::create(ruta)?);
+    writer.write_all(b"\x93NUMPY\x01\x00")?;
+    writer.write_all(&(cabecera.len() as u16).to_le_bytes())?;
+    writer.write_all(cabecera.as_bytes())?;
+    let mut bloque = Vec::with_capacity(VALORES_POR_BLOQUE * 4);
+    let total = vista.len();
+    for inicio in (0..total).step_by(VALORES_POR_BLOQUE) {
+        bloque.clear();
+        for i in inicio..(inicio + VALORES_POR_BLOQUE).min(total) {
+            bloque.extend_from_slice(&vista.valor(i).to_le_bytes());
+        }
+        writer.write_all(&bloque)?;
+    }
+    writer.flush()
+}
+
+/// Datos para visualización externa.
+///
+/// Sin `directorio` devuelve un JSON con los mapas en línea (como siempre, pero ahora
+/// siempre válido: NaN e infinitos pasan a `null`). Con `directorio` escribe
+/// `mapa_intensidad.npy` y `mapa_ratio.npy` (float32 little-endian, forma (alto, ancho)
+/// si el tamaño coincide con `dimensiones`) más un `manifiesto.json` pequeño con las
+/// dimensiones, los nombres de archivo y las métricas, y devuelve la ruta del manifiesto.
+/// Los mapas se leen con `np.load(..., mmap_mode='r')`.
 #[pyfunction]
+#[pyo3(signature = (mapa_intensidad, mapa_ratio, dimensiones, resultados, directorio = None))]
 fn exportar_datos_visualizacion(
-    mapa_intensidad: Vec<f32>,
-    mapa_ratio: Vec<f32>,
+    py: Python<'_>,
+    mapa_intensidad: MuestraEntrada<'_>,
+    mapa_ratio: MuestraEntrada<'_>,
     dimensiones: (u32, u32),
-    resultados: Vec<f32>
+    resultados: Vec<f32>,
+    directorio: Option<String>
 ) -> PyResult<String> {
-    // Generar JSON para visualización externa
-    let json_data = format!(r#"{{
-        "dimensiones": [{}, {}],
-        "mapa_intensidad": {:?},
-        "mapa_ratio": {:?},
-        "metricas_vorticidad": {:?},
-        "ratio_promedio": {:.3},
-        "conclusion": "{}"
-    }}"#,
-        dimensiones.0, dimensiones.1,
-        mapa_intensidad,
-        mapa_ratio,
-        resultados,
-        resultados.iter().sum::<f32>() / resultados.len() as f32,
-        if resultados.iter().any(|&x| x > 1.5) {
-            "POSIBLE_VORTICIDAD_DETECTADA"
-        } else {
-            "SIN_EVIDENCIA_FUERTE"
+    let (intensidad, ratio) = (mapa_intensidad.vista(), mapa_ratio.vista());
+    let ratio_promedio = resultados.iter().sum::<f32>() / resultados.len() as f32;
+    let conclusion = if resultados.iter().any(|&x| x > 1.5) {
+        "POSIBLE_VORTICIDAD_DETECTADA"
+    } else {
+        "SIN_EVIDENCIA_FUERTE"
+    };
+
+    let escribir_json = |mapas: &dyn Fn(&mut String), capacidad: usize| {
+        use std::fmt::Write as _;
+        let mut json = String::with_capacity(capacidad + 256 + resultados.len() * 16);
+        let _ = write!(json, "{{\n        \"dimensiones\": [{}, {}],\n", dimensiones.0, dimensiones.1);
+        mapas(&mut json);
+        json.push_str("        \"metricas_vorticidad\": ");
+        escribir_lista_json(&mut json, resultados.iter().copied());
+        json.push_str(",\n        \"ratio_promedio\": ");
+        escribir_numero_json(&mut json, ratio_promedio);
+        let _ = write!(json, ",\n        \"conclusion\": \"{}\"\n    }}", conclusion);
+        json
+    };
+
+    let directorio = match directorio {
+        None => {
+            return Ok(py.allow_threads(|| {
+                let mapas = |json: &mut String| {
+                    for (nombre, vista) in [("mapa_intensidad", &intensidad), ("mapa_ratio", &ratio)] {
+                        json.push_str("        \"");
+                        json.push_str(nombre);
+                        json.push_str("\": ");
+                        escribir_lista_json(json, (0..vista.len()).map(|i| vista.valor(i)));
+                        json.push_str(",\n");
+                    }
+                };
+                escribir_json(&mapas, (intensidad.len() + ratio.len()) * 12)
+            }));
         }
-    );
+        Some(directorio) => std::path::PathBuf::from(directorio),
+    };
+
+    let manifiesto = py.allow_threads(|| -> io::Result<std::path::PathBuf> {
+        std::fs::create_dir_all(&directorio)?;
+        let (ancho, alto) = (dimensiones.0 as usize, dimensiones.1 as usize);
+        for (nombre, vista) in [("mapa_intensidad", &intensidad), ("mapa_ratio", &ratio)] {
+            let forma = if vista.len() == ancho * alto { vec![alto, ancho] } else { vec![vista.len()] };
+            escribir_npy_f32(&directorio.join(format!("{}.npy", nombre)), &forma, vista)?;
+        }
+        let mapas = |json: &mut String| {
+            json.push_str("        \"formato\": \"npy\",\n");
+            json.push_str("        \"mapa_intensidad\": \"mapa_intensidad.npy\",\n");
+            json.push_str("        \"mapa_ratio\": \"mapa_ratio.npy\",\n");
+        };
+        let ruta = directorio.join("manifiesto.json");
+        std::fs::write(&ruta, escribir_json(&mapas, 0))?;
+        Ok(ruta)
+    })?;
+
+    Ok(manifiesto.to_string_lossy().into_owned())
+}
+
+// Tablas de geometría angular por forma de imagen: sin θ, cos θ y radio de cada píxel
+// respecto a un centro. Dependen solo de (ancho, alto, centro), así que se calculan
+// una vez y se comparten entre imágenes; las métricas angulares quedan en productos
+// escalares. Se guardan las más recientes en un LRU acotado por memoria.
+
+/// Bytes que pueden ocupar entre todas las geometrías del LRU (24 B por píxel: una de
+/// 1000×1000 ocupa ~24 MB). Una geometría mayor que el límite se calcula pero no se guarda.
+const BYTES_MAX_GEOMETRIAS: usize = 64 << 20;
+
+type ClaveGeometria = (usize, usize, u64, u64);
+
+/// Geometría angular de una imagen `alto × ancho` (orden de filas) respecto a `centro`.
+/// En el centro exacto sin θ = cos θ = 0.
+struct GeometriaAngular {
+    seno: Vec<f64>,
+    coseno: Vec<f64>,
+    radio: Vec<f64>,
+}
+
+impl GeometriaAngular {
+    fn calcular(ancho: usize, alto: usize, centro: (f64, f64)) -> GeometriaAngular {
+        let n = ancho * alto;
+        let mut geometria = GeometriaAngular {
+            seno: Vec::with_capacity(n),
+            coseno: Vec::with_capacity(n),
+            radio: Vec::with_capacity(n),
+        };
+        for y in 0..alto {
+            let dy = y as f64 - centro.1;
+            for x in 0..ancho {
+                let dx = x as f64 - centro.0;
+                let radio = dx.hypot(dy);
+                let (seno, coseno) = if radio > 0.0 { (dy / radio, dx / radio) } else { (0.0, 0.0) };
+                geometria.seno.push(seno);
+                geometria.coseno.push(coseno);
+                geometria.radio.push(radio);
+            }
+        }
+        geometria
+    }
+
+    fn bytes(&self) -> usize {
+        (self.seno.len() + self.coseno.len() + self.radio.len()) * std::mem::size_of::<f64>()
+    }
+}
+
+/// Busca `clave` en un LRU (más reciente al frente) y, si está, la pasa al frente.
+fn buscar_en_lru<K: PartialEq, V>(cache: &mut Vec<(K, Arc<V>)>, clave: &K) -> Option<Arc<V>> {
+    let pos = cache.iter().position(|(k, _)| k == clave)?;
+    let entrada = cache.remove(pos);
+    let valor = Arc::clone(&entrada.1);
+    cache.insert(0, entrada);
+    Some(valor)
+}
+
+fn cache_geometrias() -> &'static Mutex<Vec<(ClaveGeometria, Arc<GeometriaAngular>)>> {
+    static CACHE: OnceLock<Mutex<Vec<(ClaveGeometria, Arc<GeometriaAngular>)>>> = OnceLock::new();
+    CACHE.get_or_init(|| Mutex::new(Vec::new()))
+}
+
+/// Geometría de (ancho, alto, centro) desde el LRU, calculándola si no está. La entrada
+/// usada pasa al frente y, si no cabe en `BYTES_MAX_GEOMETRIAS`, se descartan las menos
+/// recientes.
+fn geometria_angular(ancho: usize, alto: usize, centro: (f64, f64)) -> Arc<GeometriaAngular> {
+    let clave = (ancho, alto, centro.0.to_bits(), centro.1.to_bits());
+    if let Some(geometria) = buscar_en_lru(&mut cache_geometrias().lock().unwrap_or_else(|e| e.into_inner()), &clave) {
+        return geometria;
+    }
+    // Se calcula fuera del candado; si otro hilo la insertó antes se usa la suya.
+    let geometria = Arc::new(GeometriaAngular::calcular(ancho, alto, centro));
+    let mut cache = cache_geometrias().lock().unwrap_or_else(|e| e.into_inner());
+    if let Some(pos) = cache.iter().position(|(k, _)| *k == clave) {
+        return Arc::clone(&cache[pos].1);
+    }
+    let nueva = geometria.bytes();
+    if nueva > BYTES_MAX_GEOMETRIAS {
+        return geometria;
+    }
+    let mut ocupados: usize = cache.iter().map(|(_, g)| g.bytes()).sum();
+    while ocupados + nueva > BYTES_MAX_GEOMETRIAS {
+        let (_, descartada) = cache.pop().expect("entradas que liberar");
+        ocupados -= descartada.bytes();
+    }
+    cache.insert(0, (clave, Arc::clone(&geometria)));
+    geometria
+}
+
+/// Centro geométrico (ancho/2, alto/2) que usan las métricas morfológicas.
+fn centro_geometrico(ancho: usize, alto: usize) -> (f64, f64) {
+    (ancho as f64 / 2.0, alto as f64 / 2.0)
+}
+
+// Morfología en una sola pasada por imagen: momentos brutos en f64 respecto al centro
+// geométrico (Σ I, Σ I·x, Σ I·y, Σ I·x², Σ I·y², Σ I·x·y sobre los píxeles > umbral) y la
+// métrica rotacional Σ I·sin θ sobre todos los píxeles. Los momentos centrales salen de
+// los brutos al final: μ_xx = Σ I·x² - (Σ I·x)² / Σ I, etc.
+
+/// Columnas de `analizar_morfologia_lote`.
+const COLUMNAS_MORFOLOGIA: usize = 8;
+
+/// Pila de imágenes (n_galaxias, alto, ancho) float32 o float64, sin copia.
+#[derive(FromPyObject)]
+enum PilaEntrada<'py> {
+    F32(PyReadonlyArray3<'py, f32>),
+    F64(PyReadonlyArray3<'py, f64>),
+}
+
+/// Vista de una `PilaEntrada`, utilizable sin el GIL.
+enum VistaPila<'a> {
+    F32(ArrayView3<'a, f32>),
+    F64(ArrayView3<'a, f64>),
+}
+
+impl<'py> PilaEntrada<'py> {
+    fn vista(&self) -> VistaPila<'_> {
+        match self {
+            PilaEntrada::F32(pila) => VistaPila::F32(pila.as_array()),
+            PilaEntrada::F64(pila) => VistaPila::F64(pila.as_array()),
+        }
+    }
+
+    /// (n, alto, ancho)
+    fn forma(&self) -> (usize, usize, usize) {
+        match self {
+            PilaEntrada::F32(pila) => pila.as_array().dim(),
+            PilaEntrada::F64(pila) => pila.as_array().dim(),
+        }
+    }
+}
+
+/// [cx, cy, elipticidad, patron_rotacional, mu_xx, mu_yy, mu_xy, orientacion] de una imagen.
+/// El centroide y los momentos usan los píxeles con intensidad > `umbral`; la métrica
+/// rotacional |Σ I·sin θ|, con θ medido desde (ancho/2, alto/2), usa todos. `geometria`
+/// es la de `centro_geometrico` para la forma de la imagen.
+fn morfologia_imagen<T: Copy + Into<f64>>(
+    imagen: ArrayView2<'_, T>,
+    geometria: &GeometriaAngular,
+    umbral: f64
+) -> [f64; COLUMNAS_MORFOLOGIA] {
+    let (alto, ancho) = imagen.dim();
+    let (x0, y0) = centro_geometrico(ancho, alto);
+    let (mut s0, mut sx, mut sy, mut sxx, mut syy, mut sxy, mut rotacion) = (0.0f64, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0);
+
+    for (y, (fila, seno)) in imagen.outer_iter().zip(geometria.seno.chunks_exact(ancho.max(1))).enumerate() {
+        let dy = y as f64 - y0;
+        for (x, (&valor, &seno)) in fila.iter().zip(seno).enumerate() {
+            let intensidad: f64 = valor.into();
+            let dx = x as f64 - x0;
+            rotacion += intensidad * seno;
+            if intensidad > umbral {
+                s0 += intensidad;
+                sx += intensidad * dx;
+                sy += intensidad * dy;
+                sxx += intensidad * dx * dx;
+                syy += intensidad * dy * dy;
+                sxy += intensidad * dx * dy;
+            }
+        }
+    }
 
-    Ok(json_data)
+    let (mx, my) = (sx / s0, sy / s0);
+    let mu_xx = sxx - sx * mx;
+    let mu_yy = syy - sy * my;
+    let mu_xy = sxy - sx * my;
+    let elipticidad = ((mu_xx - mu_yy) / (mu_xx + mu_yy)).abs();
+    let orientacion = 0.5 * (2.0 * mu_xy).atan2(mu_xx - mu_yy);
+    [mx + x0, my + y0, elipticidad, rotacion.abs(), mu_xx, mu_yy, mu_xy, orientacion]
 }
 
 #[pyfunction]
@@ -301,58 +2240,151 @@ fn analizar_morfologia_galaxia(
     dimensiones: (u32, u32),
     umbral_snr: f32
 ) -> PyResult<Vec<f32>> {
-    let (ancho, alto) = dimensiones;
-    let mut resultados = Vec::new();
-
-    // 1. Calcular centro de masa
-    let mut suma_x = 0.0;
-    let mut suma_y = 0.0;
-    let mut suma_total = 0.0;
+    let (ancho, alto) = (dimensiones.0 as usize, dimensiones.1 as usize);
+    // Se usan los primeros ancho × alto valores; los sobrantes se ignoran
+    let imagen = mapa_intensidad.get(..ancho * alto)
+        .and_then(|valores| ArrayView2::from_shape((alto, ancho), valores).ok())
+        .ok_or_else(|| PyValueError::new_err(format!(
+            "mapa_intensidad tiene {} valores, se esperaban al menos {}x{}", mapa_intensidad.len(), ancho, alto
+        )))?;
+
+    // Centro de masa, elipticidad y patrón rotacional
+    let geometria = geometria_angular(ancho, alto, centro_geometrico(ancho, alto));
+    let morfologia = morfologia_imagen(imagen, &geometria, umbral_snr as f64);
+    Ok(morfologia[..4].iter().map(|&v| v as f32).collect())
+}
 
-    for y in 0..alto {
-        for x in 0..ancho {
-            let idx = (y * ancho + x) as usize;
-            let intensidad = mapa_intensidad[idx];
-            if intensidad > umbral_snr {
-                suma_x += x as f32 * intensidad;
-                suma_y += y as f32 * intensidad;
-                suma_total += intensidad;
-            }
-        }
+/// Morfología de una pila de recortes (n_galaxias, alto, ancho), galaxias en paralelo.
+///
+/// Devuelve un arreglo (n_galaxias, 8) con columnas
+/// [cx, cy, elipticidad, patron_rotacional, mu_xx, mu_yy, mu_xy, orientacion]; las cuatro
+/// primeras son las de `analizar_morfologia_galaxia` y `orientacion` es el ángulo del eje
+/// mayor, ½·atan2(2μ_xy, μ_xx - μ_yy), en radianes.
+#[pyfunction]
+fn analizar_morfologia_lote<'py>(
+    py: Python<'py>,
+    imagenes: PilaEntrada<'py>,
+    umbral_snr: f32
+) -> PyResult<&'py PyArray2<f64>> {
+    fn por_galaxia<T: Copy + Into<f64> + Sync>(pila: ArrayView3<'_, T>, umbral: f64, salida: &mut [f64]) {
+        let (_, alto, ancho) = pila.dim();
+        let geometria = geometria_angular(ancho, alto, centro_geometrico(ancho, alto));
+        salida.par_chunks_mut(COLUMNAS_MORFOLOGIA).enumerate().for_each(|(g, fila)| {
+            fila.copy_from_slice(&morfologia_imagen(pila.index_axis(Axis(0), g), &geometria, umbral));
+        });
     }
 
-    let centro_x = suma_x / suma_total;
-    let centro_y = suma_y / suma_total;
-    resultados.push(centro_x);
-    resultados.push(centro_y);
-
-    // 2. Calcular elipticidad y orientación (Momentos de inercia)
-    let mut mu_xx = 0.0;
-    let mut mu_yy = 0.0;
-    let mut mu_xy = 0.0; // Advertencia: variable 'mu_xy' nunca se usa
+    let umbral = umbral_snr as f64;
+    let (n, _, _) = imagenes.forma();
+    let mut salida = vec![0.0f64; n * COLUMNAS_MORFOLOGIA];
+    let pila = imagenes.vista();
+    py.allow_threads(|| en_pool(|| match pila {
+        VistaPila::F32(pila) => por_galaxia(pila, umbral, &mut salida),
+        VistaPila::F64(pila) => por_galaxia(pila, umbral, &mut salida),
+    }));
+
+    let salida = Array2::from_shape_vec((n, COLUMNAS_MORFOLOGIA), salida)
+        .expect("n_galaxias × columnas");
+    Ok(salida.into_pyarray(py))
+}
 
-    for y in 0..alto {
-        for x in 0..ancho {
-            let idx = (y * ancho + x) as usize;
-            let intensidad = mapa_intensidad[idx];
-            if intensidad > umbral_snr {
-                let dx = x as f32 - centro_x;
-                let dy = y as f32 - centro_y;
-                mu_xx += dx * dx * intensidad;
-                mu_yy += dy * dy * intensidad;
-                mu_xy += dx * dy * intensidad;
-            }
+/// Amplitudes |Σ I·e^{imθ}| / Σ I para m = 1..=m_max de una imagen (θ desde el centro de
+/// `geometria`), sobre los píxeles a radio <= `radio_max`. e^{imθ} se obtiene por
+/// productos sucesivos de e^{iθ} = cos θ + i·sin θ.
+fn armonicos_imagen<T: Copy + Into<f64>>(
+    imagen: ArrayView2<'_, T>,
+    geometria: &GeometriaAngular,
+    radio_max: f64,
+    salida: &mut [f64]
+) {
+    let m_max = salida.len();
+    let mut real = vec![0.0f64; m_max];
+    let mut imaginaria = vec![0.0f64; m_max];
+    let mut flujo = 0.0f64;
+    let pixeles = imagen.iter().zip(geometria.coseno.iter().zip(&geometria.seno)).zip(&geometria.radio);
+    for ((&valor, (&coseno, &seno)), &radio) in pixeles {
+        if radio > radio_max {
+            continue;
+        }
+        let intensidad: f64 = valor.into();
+        flujo += intensidad;
+        let (mut c, mut s) = (coseno, seno);
+        for m in 0..m_max {
+            real[m] += intensidad * c;
+            imaginaria[m] += intensidad * s;
+            (c, s) = (c * coseno - s * seno, s * coseno + c * seno);
         }
     }
+    for m in 0..m_max {
+        salida[m] = real[m].hypot(imaginaria[m]) / flujo;
+    }
+}
 
-    let elipticidad = (mu_xx - mu_yy) / (mu_xx + mu_yy);
-    resultados.push(elipticidad.abs());
+/// Armónicos angulares de una pila de imágenes (n_galaxias, alto, ancho).
+///
+/// Devuelve (n_galaxias, m_max) con |Σ I·e^{imθ}| / Σ I para m = 1..=m_max: m = 1 mide el
+/// descentramiento, m = 2 la elongación/barra y m ≥ 3 estructura espiral o grumosa. θ se
+/// mide desde `centro` (x, y), por defecto (ancho/2, alto/2) como `patron_rotacional`;
+/// con `radio_max` solo cuentan los píxeles dentro de esa apertura.
+#[pyfunction]
+#[pyo3(signature = (imagenes, m_max = 4, centro = None, radio_max = None))]
+fn armonicos_angulares<'py>(
+    py: Python<'py>,
+    imagenes: PilaEntrada<'py>,
+    m_max: usize,
+    centro: Option<(f64, f64)>,
+    radio_max: Option<f64>
+) -> PyResult<&'py PyArray2<f64>> {
+    fn por_galaxia<T: Copy + Into<f64> + Sync>(
+        pila: ArrayView3<'_, T>,
+        geometria: &GeometriaAngular,
+        m_max: usize,
+        radio_max: f64,
+        salida: &mut [f64]
+    ) {
+        salida.par_chunks_mut(m_max).enumerate().for_each(|(g, fila)| {
+            armonicos_imagen(pila.index_axis(Axis(0), g), geometria, radio_max, fila);
+        });
+    }
 
-    // 3. Métrica simple de patrón rotacional
-    let patron_rotacional = calcular_patron_rotacional(&mapa_intensidad, dimensiones);
-    resultados.push(patron_rotacional);
+    if m_max == 0 {
+        return Err(PyValueError::new_err("m_max debe ser al menos 1"));
+    }
+    let (n, alto, ancho) = imagenes.forma();
+    let geometria = geometria_angular(ancho, alto, centro.unwrap_or_else(|| centro_geometrico(ancho, alto)));
+    let radio_max = radio_max.unwrap_or(f64::INFINITY);
+    let mut salida = vec![0.0f64; n * m_max];
+    let pila = imagenes.vista();
+    py.allow_threads(|| en_pool(|| match pila {
+        VistaPila::F32(pila) => por_galaxia(pila, &geometria, m_max, radio_max, &mut salida),
+        VistaPila::F64(pila) => por_galaxia(pila, &geometria, m_max, radio_max, &mut salida),
+    }));
+
+    let salida = Array2::from_shape_vec((n, m_max), salida).expect("n_galaxias × m_max");
+    Ok(salida.into_pyarray(py))
+}
 
-    Ok(resultados)
+/// Configuraciones del bispectro de los mapas de cociente [OIII]/[CII].
+const CONFIGS_PATRONES_LINEAS: [(u32, u32, u32); 3] = [(2, 2, 2), (3, 3, 3), (2, 3, 4)];
+
+/// Escribe en `destino` el cociente [OIII]/[CII] de cada píxel (0 donde [CII] <= 0) y
+/// devuelve (n_validos, suma, máximo) de los cocientes finitos, en la misma pasada.
+/// El máximo parte de 0, como en `calcular_patrones_lineas`.
+fn cocientes_lineas(
+    oiii: impl Iterator<Item = f64>,
+    cii: impl Iterator<Item = f64>,
+    destino: &mut [f32]
+) -> (usize, f64, f32) {
+    let (mut n_validos, mut suma, mut maximo) = (0usize, 0.0f64, 0.0f32);
+    for ((o, c), ratio) in oiii.zip(cii).zip(destino.iter_mut()) {
+        *ratio = if c > 0.0 { (o / c) as f32 } else { 0.0 };
+        if c > 0.0 && ratio.is_finite() {
+            n_validos += 1;
+            suma += *ratio as f64;
+            maximo = maximo.max(*ratio);
+        }
+    }
+    (n_validos, suma, maximo)
 }
 
 #[pyfunction]
@@ -364,73 +2396,342 @@ fn calcular_patrones_lineas(
     let (ancho, alto) = dimensiones;
     let mut resultados = Vec::new();
 
-    // 1. Calcular ratio [OIII]/[CII] pixel a pixel
-    let mut mapa_ratio = Vec::new();
-    let mut ratios_validos = Vec::new();
-
-    for i in 0..mapa_oiii.len() {
-        if i < mapa_cii.len() && mapa_cii[i] > 0.0 {
-            let ratio = mapa_oiii[i] / mapa_cii[i];
-            mapa_ratio.push(ratio);
-            if ratio.is_finite() {
-                ratios_validos.push(ratio);
-            }
-        } else {
-            mapa_ratio.push(0.0);
-        }
-    }
+    // 1. Calcular ratio [OIII]/[CII] pixel a pixel (y sus estadísticas en la misma pasada)
+    let mut mapa_ratio = vec![0.0f32; mapa_oiii.len()];
+    let cii = (0..mapa_oiii.len()).map(|i| mapa_cii.get(i).map_or(0.0, |&c| c as f64));
+    let (n_validos, suma, maximo) = cocientes_lineas(
+        mapa_oiii.iter().map(|&o| o as f64), cii, &mut mapa_ratio
+    );
 
     // 2. Aplicar bispectro adaptado al mapa de ratios
-    let configs = vec![(2, 2, 2), (3, 3, 3), (2, 3, 4)];
+    let configs = CONFIGS_PATRONES_LINEAS.to_vec();
     let bispectro_resultados = calcular_bispectro_adaptado_2d(&mapa_ratio, ancho, alto, configs);
 
     resultados.extend(bispectro_resultados);
 
-    // 3. Calcular estadísticas del ratio
-    if !ratios_validos.is_empty() {
-        let ratio_promedio: f32 = ratios_validos.iter().sum::<f32>() / ratios_validos.len() as f32;
-        resultados.push(ratio_promedio);
-
-        let ratio_max = ratios_validos.iter().fold(0.0f32, |a, &b| a.max(b));
-        resultados.push(ratio_max);
+    // 3. Estadísticas del ratio
+    if n_validos > 0 {
+        resultados.push((suma / n_validos as f64) as f32);
+        resultados.push(maximo);
     }
 
     Ok(resultados)
 }
 
-// Función auxiliar para patrón rotacional
-fn calcular_patron_rotacional(mapa: &[f32], dimensiones: (u32, u32)) -> f32 {
-    let (ancho, alto) = dimensiones;
-    let mut asimetria_angular = 0.0;
+/// Patrones de líneas para pilas de mapas [OIII] y [CII] (n_mapas, alto, ancho) de igual
+/// forma, mapas en paralelo.
+///
+/// Escribe los mapas de cociente (float32, 0 donde [CII] <= 0) en `salida_ratio` si se pasa
+/// (float32 C-contiguo de la misma forma) o en un arreglo nuevo, y devuelve
+/// `(mapas_ratio, estadisticas)`. `estadisticas` es (n_mapas, 3 + n_configs) con columnas
+/// [n_validos, ratio_promedio, ratio_max, B(config_1), ...]; promedio y máximo son NaN en
+/// mapas sin cocientes válidos. `configs` por defecto: (2,2,2), (3,3,3), (2,3,4).
+#[pyfunction]
+#[pyo3(signature = (mapas_oiii, mapas_cii, configs = None, salida_ratio = None))]
+fn calcular_patrones_lineas_lote<'py>(
+    py: Python<'py>,
+    mapas_oiii: PilaEntrada<'py>,
+    mapas_cii: PilaEntrada<'py>,
+    configs: Option<Vec<(u32, u32, u32)>>,
+    salida_ratio: Option<&'py PyArray3<f32>>
+) -> PyResult<(&'py PyArray3<f32>, &'py PyArray2<f64>)> {
+    fn por_mapa<A, B>(
+        oiii: ArrayView3<'_, A>,
+        cii: ArrayView3<'_, B>,
+        configs: &[(u32, u32, u32)],
+        ratios: &mut [f32],
+        estadisticas: &mut [f64]
+    ) where
+        A: Copy + Into<f64> + Sync,
+        B: Copy + Into<f64> + Sync,
+    {
+        let (n, alto, ancho) = oiii.dim();
+        if n == 0 || alto * ancho == 0 {
+            return;
+        }
+        let estimador = (!configs.is_empty()).then(|| estimador_bispectro_2d(ancho, alto, configs));
+        let columnas = 3 + configs.len();
+        ratios.par_chunks_mut(alto * ancho).zip(estadisticas.par_chunks_mut(columnas)).enumerate()
+            .for_each(|(i, (ratio, fila))| {
+                let (n_validos, suma, maximo) = cocientes_lineas(
+                    oiii.index_axis(Axis(0), i).iter().map(|&v| Into::<f64>::into(v)),
+                    cii.index_axis(Axis(0), i).iter().map(|&v| Into::<f64>::into(v)),
+                    ratio
+                );
+                fila[0] = n_validos as f64;
+                (fila[1], fila[2]) = if n_validos > 0 {
+                    (suma / n_validos as f64, maximo as f64)
+                } else {
+                    (f64::NAN, f64::NAN)
+                };
+                if let Some(estimador) = &estimador {
+                    let mapa = ArrayView2::from_shape((alto, ancho), &*ratio).expect("alto × ancho");
+                    fila[3..].copy_from_slice(&estimador.calcular(mapa));
+                }
+            });
+    }
 
-    // Análisis simple de simetría angular, asumiendo centro en (ancho/2, alto/2)
-    for y in 0..alto {
-        for x in 0..ancho {
-            let idx = (y * ancho + x) as usize;
-            if idx < mapa.len() {
-                let dx = x as f32 - ancho as f32 / 2.0;
-                let dy = y as f32 - alto as f32 / 2.0;
-                let angulo = dy.atan2(dx);
-                asimetria_angular += mapa[idx] * angulo.sin();
+    let configs = configs.unwrap_or_else(|| CONFIGS_PATRONES_LINEAS.to_vec());
+    let (forma, forma_cii) = (mapas_oiii.forma(), mapas_cii.forma());
+    if forma != forma_cii {
+        return Err(PyValueError::new_err(format!(
+            "mapas_oiii {:?} y mapas_cii {:?} deben tener la misma forma", forma, forma_cii
+        )));
+    }
+    let forma = [forma.0, forma.1, forma.2];
+    let salida_ratio = match salida_ratio {
+        Some(arr) if arr.shape() != forma => {
+            return Err(PyValueError::new_err(format!(
+                "salida_ratio debe tener forma {:?}, recibido {:?}", forma, arr.shape()
+            )));
+        }
+        Some(arr) => arr,
+        None => PyArray3::zeros(py, forma, false),
+    };
+    let mut escritura = salida_ratio.try_readwrite()
+        .map_err(|e| PyValueError::new_err(format!("salida_ratio no escribible: {}", e)))?;
+    let ratios = escritura.as_slice_mut()
+        .map_err(|_| PyValueError::new_err("salida_ratio debe ser C-contigua"))?;
+    let mut estadisticas = vec![0.0f64; forma[0] * (3 + configs.len())];
+
+    let (oiii, cii) = (mapas_oiii.vista(), mapas_cii.vista());
+    py.allow_threads(|| en_pool(|| match (oiii, cii) {
+        (VistaPila::F32(a), VistaPila::F32(b)) => por_mapa(a, b, &configs, ratios, &mut estadisticas),
+        (VistaPila::F32(a), VistaPila::F64(b)) => por_mapa(a, b, &configs, ratios, &mut estadisticas),
+        (VistaPila::F64(a), VistaPila::F32(b)) => por_mapa(a, b, &configs, ratios, &mut estadisticas),
+        (VistaPila::F64(a), VistaPila::F64(b)) => por_mapa(a, b, &configs, ratios, &mut estadisticas),
+    }));
+
+    let estadisticas = Array2::from_shape_vec((forma[0], 3 + configs.len()), estadisticas)
+        .expect("n_mapas × columnas");
+    Ok((salida_ratio, estadisticas.into_pyarray(py)))
+}
+
+// Bispectro 2D por FFT. Con F = FFT(mapa - media) y, para cada cáscara |k| ≈ l,
+//   I_l(x) = Σ_{k ∈ l} F_k e^{ik·x}   y   N_l(x) = Σ_{k ∈ l} e^{ik·x}
+// (transformadas inversas sin normalizar), Σ_x I1·I2·I3 / Σ_x N1·N2·N3 es el promedio de
+// F_k1·F_k2·F_k3 sobre los triángulos cerrados k1 + k2 + k3 = 0 con |k_i| en cada cáscara,
+// y Σ_x N1·N2·N3 / n_pixeles es el número de esos triángulos. |k| se mide en modos
+// fundamentales de cada eje y se redondea al entero más próximo.
+
+/// FFT 1D de filas y columnas para una forma de mapa (ida y vuelta).
+struct PlanesFft2d {
+    filas: Arc<dyn rustfft::Fft<f64>>,
+    columnas: Arc<dyn rustfft::Fft<f64>>,
+    filas_inversa: Arc<dyn rustfft::Fft<f64>>,
+    columnas_inversa: Arc<dyn rustfft::Fft<f64>>,
+}
+
+/// Formas de mapa cuyos planes FFT se conservan.
+const CAPACIDAD_PLANES_FFT: usize = 32;
+
+/// Estimadores de bispectro 2D (forma + configuraciones) que se conservan.
+const CAPACIDAD_ESTIMADORES_2D: usize = 8;
+
+/// Planes FFT de (ancho, alto), creados una vez por forma y compartidos. Se guardan las
+/// `CAPACIDAD_PLANES_FFT` formas más recientes.
+fn planes_fft_2d(ancho: usize, alto: usize) -> Arc<PlanesFft2d> {
+    static PLANES: OnceLock<Mutex<Vec<((usize, usize), Arc<PlanesFft2d>)>>> = OnceLock::new();
+    let mut planes = PLANES.get_or_init(|| Mutex::new(Vec::with_capacity(CAPACIDAD_PLANES_FFT)))
+        .lock()
+        .unwrap_or_else(|e| e.into_inner());
+    if let Some(encontrados) = buscar_en_lru(&mut planes, &(ancho, alto)) {
+        return encontrados;
+    }
+    let mut planificador = rustfft::FftPlanner::<f64>::new();
+    let nuevos = Arc::new(PlanesFft2d {
+        filas: planificador.plan_fft_forward(ancho),
+        columnas: planificador.plan_fft_forward(alto),
+        filas_inversa: planificador.plan_fft_inverse(ancho),
+        columnas_inversa: planificador.plan_fft_inverse(alto),
+    });
+    planes.truncate(CAPACIDAD_PLANES_FFT - 1);
+    planes.insert(0, ((ancho, alto), Arc::clone(&nuevos)));
+    nuevos
+}
+
+type Complejo = rustfft::num_complex::Complex<f64>;
+
+/// Transpone `origen` (alto × ancho, por filas) en `destino` (ancho × alto).
+fn transponer(origen: &[Complejo], destino: &mut [Complejo], ancho: usize, alto: usize) {
+    for (y, fila) in origen.chunks_exact(ancho).enumerate() {
+        for (x, &valor) in fila.iter().enumerate() {
+            destino[x * alto + y] = valor;
+        }
+    }
+}
+
+impl PlanesFft2d {
+    /// FFT 2D en sitio de `datos` (alto × ancho, por filas), sin normalizar.
+    fn transformar(&self, datos: &mut [Complejo], ancho: usize, alto: usize, inversa: bool) {
+        let (filas, columnas) = if inversa {
+            (&self.filas_inversa, &self.columnas_inversa)
+        } else {
+            (&self.filas, &self.columnas)
+        };
+        filas.process(datos);
+        let mut transpuesta = vec![Complejo::new(0.0, 0.0); datos.len()];
+        transponer(datos, &mut transpuesta, ancho, alto);
+        columnas.process(&mut transpuesta);
+        transponer(&transpuesta, datos, alto, ancho);
+    }
+}
+
+/// Estimador de bispectro 2D para una forma de mapa y una lista de configuraciones. Lo que
+/// solo depende de la forma (cáscara de cada modo, número de triángulos) se calcula en
+/// `nuevo`, así que un mismo estimador sirve para todos los mapas de un lote.
+struct BispectroFft2d {
+    ancho: usize,
+    alto: usize,
+    planes: Arc<PlanesFft2d>,
+    /// Cáscara |k| redondeada de cada modo (orden de la FFT).
+    cascara: Vec<u32>,
+    /// Cáscaras distintas que aparecen en las configuraciones.
+    ls: Vec<u32>,
+    /// Posición en `ls` de cada lado de cada configuración.
+    lados: Vec<[usize; 3]>,
+    /// Σ_x N1·N2·N3 de cada configuración (0 si no cierra ningún triángulo).
+    normas: Vec<f64>,
+}
+
+impl BispectroFft2d {
+    fn nuevo(ancho: usize, alto: usize, configs: &[(u32, u32, u32)]) -> BispectroFft2d {
+        let frecuencia = |i: usize, n: usize| if i <= n / 2 { i as f64 } else { i as f64 - n as f64 };
+        let mut cascara = Vec::with_capacity(ancho * alto);
+        for ky in 0..alto {
+            for kx in 0..ancho {
+                cascara.push(frecuencia(kx, ancho).hypot(frecuencia(ky, alto)).round() as u32);
             }
         }
+
+        let mut ls: Vec<u32> = configs.iter().flat_map(|&(l1, l2, l3)| [l1, l2, l3]).collect();
+        ls.sort_unstable();
+        ls.dedup();
+        let posicion = |l: u32| ls.binary_search(&l).expect("l presente");
+        let lados: Vec<[usize; 3]> = configs.iter()
+            .map(|&(l1, l2, l3)| [posicion(l1), posicion(l2), posicion(l3)])
+            .collect();
+
+        let mut estimador = BispectroFft2d {
+            ancho, alto, planes: planes_fft_2d(ancho, alto), cascara, ls, lados, normas: Vec::new(),
+        };
+        let unos = vec![Complejo::new(1.0, 0.0); ancho * alto];
+        let conteos = estimador.campos_filtrados(&unos);
+        estimador.normas = estimador.sumas_triples(&conteos);
+        estimador
+    }
+
+    /// Re IFFT(campo · 1_l) para cada cáscara de `ls`, en paralelo.
+    fn campos_filtrados(&self, campo: &[Complejo]) -> Vec<Vec<f64>> {
+        self.ls.par_iter().map(|&l| {
+            let mut filtrado: Vec<Complejo> = campo.iter().zip(&self.cascara)
+                .map(|(&valor, &c)| if c == l { valor } else { Complejo::new(0.0, 0.0) })
+                .collect();
+            self.planes.transformar(&mut filtrado, self.ancho, self.alto, true);
+            filtrado.iter().map(|z| z.re).collect()
+        }).collect()
+    }
+
+    /// Σ_x f1·f2·f3 de cada configuración, configuraciones en paralelo.
+    fn sumas_triples(&self, campos: &[Vec<f64>]) -> Vec<f64> {
+        self.lados.par_iter().map(|&[a, b, c]| {
+            campos[a].iter().zip(&campos[b]).zip(&campos[c]).map(|((x, y), z)| x * y * z).sum()
+        }).collect()
+    }
+
+    /// Bispectro de cada configuración para `mapa` (alto × ancho, por filas); NaN en las
+    /// configuraciones sin triángulos en la rejilla.
+    fn calcular<T: Copy + Into<f64>>(&self, mapa: ArrayView2<'_, T>) -> Vec<f64> {
+        let valores = mapa.iter().map(|&v| Into::<f64>::into(v));
+        let media = valores.clone().sum::<f64>() / mapa.len() as f64;
+        let mut transformada: Vec<Complejo> = valores.map(|v| Complejo::new(v - media, 0.0)).collect();
+        self.planes.transformar(&mut transformada, self.ancho, self.alto, false);
+        let campos = self.campos_filtrados(&transformada);
+        let n_pixeles = (self.ancho * self.alto) as f64;
+        self.sumas_triples(&campos).iter().zip(&self.normas)
+            .map(|(&suma, &norma)| if norma / n_pixeles >= 0.5 { suma / norma } else { f64::NAN })
+            .collect()
     }
+}
 
-    asimetria_angular.abs()
+type ClaveEstimador2d = (usize, usize, Vec<(u32, u32, u32)>);
+
+/// Estimador de (ancho, alto, configs) desde un LRU de `CAPACIDAD_ESTIMADORES_2D`
+/// entradas: las llamadas repetidas con la misma forma y configuraciones no recalculan
+/// cáscaras ni normas.
+fn estimador_bispectro_2d(ancho: usize, alto: usize, configs: &[(u32, u32, u32)]) -> Arc<BispectroFft2d> {
+    static ESTIMADORES: OnceLock<Mutex<Vec<(ClaveEstimador2d, Arc<BispectroFft2d>)>>> = OnceLock::new();
+    let cache = ESTIMADORES.get_or_init(|| Mutex::new(Vec::with_capacity(CAPACIDAD_ESTIMADORES_2D)));
+    let clave = (ancho, alto, configs.to_vec());
+    if let Some(estimador) = buscar_en_lru(&mut cache.lock().unwrap_or_else(|e| e.into_inner()), &clave) {
+        return estimador;
+    }
+    // Se construye fuera del candado (usa rayon); si otro hilo lo insertó antes se usa el suyo.
+    let estimador = Arc::new(BispectroFft2d::nuevo(ancho, alto, configs));
+    let mut cache = cache.lock().unwrap_or_else(|e| e.into_inner());
+    if let Some(pos) = cache.iter().position(|(k, _)| *k == clave) {
+        return Arc::clone(&cache[pos].1);
+    }
+    cache.truncate(CAPACIDAD_ESTIMADORES_2D - 1);
+    cache.insert(0, (clave, Arc::clone(&estimador)));
+    estimador
 }
 
-// Bispectro adaptado para mapas 2D - AÚN PLACEHOLDER
+// Bispectro adaptado para mapas 2D: estimador FFT sobre los primeros ancho × alto valores
+// del mapa. Si tiene menos se devuelve NaN en todas las configuraciones.
 fn calcular_bispectro_adaptado_2d(
     mapa: &[f32],
     ancho: u32,
     alto: u32,
     configs: Vec<(u32, u32, u32)>
 ) -> Vec<f32> {
-    // ⚠️ Advertencia: ESTE ES UN PLACEHOLDER. Debe ser implementado para un análisis 2D serio.
-    // Ignorando temporalmente las variables no utilizadas para evitar warnings aquí.
-    let _ = (mapa, ancho, alto); 
+    let (ancho, alto) = (ancho as usize, alto as usize);
+    let mapa = match mapa.get(..ancho * alto).map(|valores| ArrayView2::from_shape((alto, ancho), valores)) {
+        Some(Ok(mapa)) if ancho > 0 && alto > 0 => mapa,
+        _ => return vec![f32::NAN; configs.len()],
+    };
+    estimador_bispectro_2d(ancho, alto, &configs)
+        .calcular(mapa)
+        .into_iter()
+        .map(|b| b as f32)
+        .collect()
+}
 
-    configs.iter().map(|&(l1, l2, l3)| {
-        (l1 + l2 + l3) as f32 * 0.1 
-    }).collect()
+/// Bispectro 2D por FFT de una pila de mapas (n_mapas, alto, ancho).
+///
+/// Cada configuración (l1, l2, l3) promedia F_k1·F_k2·F_k3 sobre los triángulos cerrados
+/// con |k_i| ≈ l_i (en modos fundamentales de cada eje, FFT sin normalizar del mapa menos
+/// su media). Devuelve (n_mapas, n_configs); NaN donde la rejilla no tiene triángulos.
+/// Los planes FFT se reutilizan por forma y los mapas se procesan en paralelo.
+#[pyfunction]
+fn calcular_bispectro_2d<'py>(
+    py: Python<'py>,
+    mapas: PilaEntrada<'py>,
+    configs: Vec<(u32, u32, u32)>
+) -> PyResult<&'py PyArray2<f64>> {
+    fn por_mapa<T: Copy + Into<f64> + Sync>(
+        pila: ArrayView3<'_, T>,
+        configs: &[(u32, u32, u32)],
+        salida: &mut [f64]
+    ) {
+        let (_, alto, ancho) = pila.dim();
+        let estimador = estimador_bispectro_2d(ancho, alto, configs);
+        salida.par_chunks_mut(configs.len()).enumerate().for_each(|(i, fila)| {
+            fila.copy_from_slice(&estimador.calcular(pila.index_axis(Axis(0), i)));
+        });
+    }
+
+    let (n, alto, ancho) = mapas.forma();
+    if configs.is_empty() || ancho == 0 || alto == 0 {
+        return Err(PyValueError::new_err("se necesitan configuraciones y mapas no vacíos"));
+    }
+    let mut salida = vec![0.0f64; n * configs.len()];
+    let pila = mapas.vista();
+    py.allow_threads(|| en_pool(|| match pila {
+        VistaPila::F32(pila) => por_mapa(pila, &configs, &mut salida),
+        VistaPila::F64(pila) => por_mapa(pila, &configs, &mut salida),
+    }));
+
+    let salida = Array2::from_shape_vec((n, configs.len()), salida).expect("n_mapas × n_configs");
+    Ok(salida.into_pyarray(py))
 }